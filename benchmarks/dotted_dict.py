@@ -0,0 +1,177 @@
+# Copyright 2017 Rackspace US, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Compare memory use and speed of `DottedDict` against the old version.
+
+A context like the one `yolo` builds for every command is constructed from
+nested dicts (with a configurable number of stack outputs), and then:
+
+- "construct": build the context
+- "first access": build it and read `stage.region` and every stage output
+  (this is where nested dicts get wrapped now)
+- "access": read `stage.region` and every stage output again
+- "memory": memory allocated for 100 contexts (needs Python 3)
+
+Usage:
+
+    python benchmarks/dotted_dict.py [--outputs N] [--runs N]
+"""
+from __future__ import print_function
+
+import argparse
+import os
+import re
+import sys
+import timeit
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from yolo.utils import DottedDict  # noqa: E402
+
+try:
+    import tracemalloc
+except ImportError:
+    # Python2
+    tracemalloc = None
+
+
+class LegacyDottedDict(dict):
+    """The previous :class:`yolo.utils.DottedDict` implementation."""
+    def __init__(self, *args, **kwargs):
+        super(LegacyDottedDict, self).__init__(*args, **kwargs)
+        for arg in args:
+            if isinstance(arg, dict):
+                for key, value in arg.items():
+                    if isinstance(value, dict):
+                        value = LegacyDottedDict(**value)
+                    self[key] = value
+
+        if kwargs:
+            for key, value in kwargs.items():
+                if isinstance(value, dict):
+                    value = LegacyDottedDict(**value)
+                self[key] = value
+
+        # Catch for case of importing values in the .items() format
+        if self.items() and not self.__dict__.items():
+            for key, value in self.items():
+                self.__setitem__(key, value)
+
+    def __getattr__(self, attr):
+        try:
+            return self.__dict__[attr]
+        # Do this to match python default behavior
+        except KeyError:
+            raise AttributeError(attr)
+
+    def __setattr__(self, key, value):
+        if self._is_valid_identifier(key):
+            self.__setitem__(key, value)
+
+    def __setitem__(self, key, value):
+        if self._is_valid_identifier(key):
+            super(LegacyDottedDict, self).__setitem__(key, value)
+            self.__dict__.update({key: value})
+
+    def __delattr__(self, item):
+        self.__delitem__(item)
+
+    def __delitem__(self, key):
+        super(LegacyDottedDict, self).__delitem__(key)
+        del self.__dict__[key]
+
+    def _is_valid_identifier(self, identifier):
+        """Test if a key identifier is valid according to the Python lexer.
+
+        Source: https://stackoverflow.com/questions/10120295/valid-characters-in-a-python-class-name
+        """
+        python_keywords = [
+            'False', 'None', 'True', 'and', 'as', 'assert', 'break', 'class',
+            'continue', 'def', 'del', 'elif', 'else', 'except', 'finally',
+            'for', 'from', 'global', 'if', 'import', 'in', 'is', 'lambda',
+            'nonlocal', 'not', 'or', 'pass', 'raise', 'return', 'try', 'while',
+            'with', 'yield'
+        ]
+        if (identifier not in python_keywords and
+                re.match('[a-zA-Z_][a-zA-Z0-9_]*', identifier)):
+            return True
+        raise SyntaxError(
+            'Key name is not a valid identifier or is reserved keyword.'
+        )
+
+
+def _context_data(num_outputs):
+    outputs = {'Output{}'.format(i): 'value-{}'.format(i)
+               for i in range(num_outputs)}
+    return dict(
+        metadata={'timestamp': '2017-10-03T20:38:03', 'version_hash': 'abc'},
+        stage={'name': 'dev', 'region': 'us-east-1', 'outputs': outputs},
+        account={
+            'name': 'mydev', 'account_number': '111222333444',
+            'default_region': 'us-west-2', 'outputs': dict(outputs),
+        },
+    )
+
+
+def _access(context):
+    context.stage.region
+    for key in context.stage.outputs:
+        getattr(context.stage.outputs, key)
+
+
+def _memory(cls, data):
+    tracemalloc.start()
+    start = tracemalloc.get_traced_memory()[0]
+    contexts = [cls(**data) for _ in range(100)]
+    for context in contexts:
+        # Nested dicts are only wrapped when accessed.
+        _access(context)
+    used = tracemalloc.get_traced_memory()[0] - start
+    tracemalloc.stop()
+    return used
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--outputs', type=int, default=50)
+    parser.add_argument('--runs', type=int, default=1000)
+    args = parser.parse_args()
+
+    data = _context_data(args.outputs)
+    print('{:<6} {:>14} {:>14} {:>14} {:>14}'.format(
+        '', 'construct', 'first access', 'access', 'memory'
+    ))
+    for name, cls in (('old', LegacyDottedDict), ('new', DottedDict)):
+        context = cls(**data)
+        _access(context)
+        timings = [
+            min(timeit.repeat(func, number=args.runs, repeat=3)) / args.runs
+            for func in (
+                lambda: cls(**data),
+                lambda: _access(cls(**data)),
+                lambda: _access(context),
+            )
+        ]
+        if tracemalloc is not None:
+            memory = '{:>11.1f} kB'.format(_memory(cls, data) / 1024.0)
+        else:
+            memory = '{:>14}'.format('n/a')
+        print('{:<6} {:>11.1f} us {:>11.1f} us {:>11.1f} us {}'.format(
+            name, *([timing * 1e6 for timing in timings] + [memory])
+        ))
+
+
+if __name__ == '__main__':
+    main()
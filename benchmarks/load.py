@@ -0,0 +1,115 @@
+# Copyright 2017 Rackspace US, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Compare the ways of loading a large yolo.yaml file.
+
+The services from `example.yolo.yaml` are copied as many times as needed to
+build a large yolo file, which is then loaded:
+
+- "pure Python": pure Python YAML loader + schema validation (the old way)
+- "C loader": C-based YAML loader (if available) + schema validation
+- "cached": parsed and validated contents read from the `.yolo` cache
+
+Usage:
+
+    python benchmarks/load.py [--services N] [--runs N]
+"""
+from __future__ import print_function
+
+import argparse
+import copy
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from ruamel import yaml  # noqa: E402
+
+from yolo.cache import FileCache  # noqa: E402
+from yolo.yolo_file import YoloFile  # noqa: E402
+
+
+def _write_yolo_file(path, num_services):
+    with open(os.path.join(REPO_ROOT, 'example.yolo.yaml')) as fp:
+        content = yaml.safe_load(fp)
+    [(name, service)] = list(content['services'].items())[:1]
+    content['services'] = {
+        '{}{}'.format(name, i): copy.deepcopy(service)
+        for i in range(num_services)
+    }
+    with open(path, 'w') as fp:
+        yaml.dump(content, fp, Dumper=yaml.RoundTripDumper)
+
+
+def _time(func, runs):
+    timings = []
+    for _ in range(runs):
+        start = time.time()
+        func()
+        timings.append(time.time() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--services', type=int, default=300)
+    parser.add_argument('--runs', type=int, default=3)
+    args = parser.parse_args()
+
+    temp_dir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(temp_dir, 'yolo.yaml')
+        _write_yolo_file(path, args.services)
+        with open(path) as fp:
+            num_lines = len(fp.readlines())
+        print('yolo file: {} services, {} lines'.format(
+            args.services, num_lines
+        ))
+
+        def load_pure_python():
+            with open(path) as fp:
+                return YoloFile(yaml.safe_load(fp))
+
+        cache = FileCache(os.path.join(temp_dir, '.yolo', 'cache'))
+        expected = load_pure_python()._raw_content
+        # Fill the cache:
+        if YoloFile.from_path(path, cache=cache)._raw_content != expected:
+            print('Loaded contents differ!')
+            sys.exit(1)
+
+        timings = [
+            ('pure Python', _time(load_pure_python, args.runs)),
+            ('C loader', _time(lambda: YoloFile.from_path(path), args.runs)),
+            ('cached', _time(
+                lambda: YoloFile.from_path(path, cache=cache), args.runs
+            )),
+        ]
+    finally:
+        shutil.rmtree(temp_dir)
+
+    if not hasattr(yaml, 'CSafeLoader'):
+        print('Note: the C-based YAML loader is not available.')
+    baseline = timings[0][1]
+    for name, timing in timings:
+        print('{:<14} {:>9.1f}ms {:>7.1f}x'.format(
+            name, timing * 1000, baseline / timing
+        ))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,161 @@
+# Copyright 2017 Rackspace US, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Compare the ways of copying a source tree into a build container.
+
+A large source tree is generated and "copied" into a fake container, which
+consumes the tar archive at a fixed rate (like the Docker daemon would):
+
+- "in-memory": the whole archive is built in memory first (the old way)
+- "streaming": the archive is generated while it is being sent
+
+Each way runs in a fresh interpreter, so that its peak RSS can be measured.
+
+Usage:
+
+    python benchmarks/put_files.py [--size-mb N] [--rate-mb N]
+"""
+from __future__ import print_function
+
+import argparse
+import io
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tarfile
+import tempfile
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from yolo import build  # noqa: E402
+
+FILE_SIZE = 1024 * 1024
+READ_SIZE = 64 * 1024
+
+
+class FakeContainer(object):
+    """Consumes tar data at ``rate`` bytes per second."""
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.received = 0
+
+    def _consume(self, chunk):
+        self.received += len(chunk)
+        time.sleep(float(len(chunk)) / self.rate)
+
+    def put_archive(self, path, data):
+        if hasattr(data, 'read'):
+            for chunk in iter(lambda: data.read(READ_SIZE), b''):
+                self._consume(chunk)
+        else:
+            for chunk in data:
+                self._consume(chunk)
+        return True
+
+
+def legacy_put_files(container, src_dir, path, single_file_name=None):
+    stream = io.BytesIO()
+
+    with tarfile.open(fileobj=stream, mode='w') as tar:
+        if single_file_name:
+            arcname = single_file_name
+        else:
+            arcname = "/"
+        tar.add(src_dir, arcname=arcname)
+    stream.seek(0)
+    container.put_archive(data=stream, path=path)
+
+
+def _make_tree(root, size_mb):
+    chunk = os.urandom(FILE_SIZE)
+    for i in range(size_mb):
+        subdir = os.path.join(root, 'pkg{}'.format(i // 50))
+        if not os.path.isdir(subdir):
+            os.makedirs(subdir)
+        with open(os.path.join(subdir, 'file{}.bin'.format(i)), 'wb') as fp:
+            fp.write(chunk)
+
+
+def _max_rss_mb():
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        # Bytes on macOS, kilobytes elsewhere
+        max_rss /= 1024
+    return max_rss / 1024.0
+
+
+def _run_one(mode, src_dir, rate):
+    put_files = legacy_put_files if mode == 'in-memory' else build.put_files
+    container = FakeContainer(rate)
+    baseline_rss = _max_rss_mb()
+    start = time.time()
+    put_files(container, src_dir, '/src')
+    print(json.dumps(dict(
+        wall_time=time.time() - start,
+        peak_rss=_max_rss_mb(),
+        baseline_rss=baseline_rss,
+        received=container.received,
+    )))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--size-mb', type=int, default=200)
+    parser.add_argument('--rate-mb', type=int, default=400)
+    parser.add_argument('--run', choices=['in-memory', 'streaming'],
+                        help=argparse.SUPPRESS)
+    parser.add_argument('--src-dir', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    rate = args.rate_mb * 1024 * 1024
+
+    if args.run:
+        _run_one(args.run, args.src_dir, rate)
+        return
+
+    temp_dir = tempfile.mkdtemp()
+    try:
+        _make_tree(temp_dir, args.size_mb)
+        print('source tree: {} MB, transfer rate: {} MB/s'.format(
+            args.size_mb, args.rate_mb
+        ))
+        results = []
+        for mode in ('in-memory', 'streaming'):
+            output = subprocess.check_output([
+                sys.executable, os.path.abspath(__file__),
+                '--run', mode, '--src-dir', temp_dir,
+                '--rate-mb', str(args.rate_mb),
+            ])
+            results.append((mode, json.loads(output.decode('utf-8'))))
+    finally:
+        shutil.rmtree(temp_dir)
+
+    if results[0][1]['received'] != results[1][1]['received']:
+        print('Archive sizes differ!')
+        sys.exit(1)
+    print('{:<10} {:>10} {:>14}'.format('', 'wall time', 'peak RSS'))
+    for mode, result in results:
+        print('{:<10} {:>9.2f}s {:>7.0f}MB (+{:.0f}MB)'.format(
+            mode, result['wall_time'], result['peak_rss'],
+            result['peak_rss'] - result['baseline_rss'],
+        ))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+# Copyright 2017 Rackspace US, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Compare rendering a yolo file as a whole YAML document and value by value.
+
+The services from `example.yolo.yaml` are copied as many times as needed to
+build a large yolo file, which is then rendered with the same variables:
+
+- "document": dump to YAML, render, parse and validate again (the old way)
+- "compiled (cold)": value by value, with empty template/result caches
+- "compiled (memoized)": value by value, rendered before with the same
+  variables
+
+Usage:
+
+    python benchmarks/render.py [--services N] [--runs N]
+"""
+from __future__ import print_function
+
+import argparse
+import copy
+import os
+import sys
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from ruamel import yaml  # noqa: E402
+
+from yolo import utils  # noqa: E402
+from yolo import yolo_file  # noqa: E402
+
+
+def _build_yolo_file(num_services):
+    with open(os.path.join(REPO_ROOT, 'example.yolo.yaml')) as fp:
+        content = yaml.safe_load(fp)
+    [(name, service)] = list(content['services'].items())[:1]
+    content['services'] = {
+        '{}{}'.format(name, i): copy.deepcopy(service)
+        for i in range(num_services)
+    }
+    return yolo_file.YoloFile(content)
+
+
+def _variables():
+    return dict(
+        metadata={'timestamp': '2017-10-03T20:38:03', 'version_hash': 'abc'},
+        stage=utils.DottedDict(
+            name='dev', region='us-east-1',
+            outputs={
+                'APIGatewayLambdaInvokeRole': 'invoker',
+                'LambdaExecutionRole': 'arn:aws:iam::111222333444:role/x',
+            },
+        ),
+        account=utils.DottedDict(
+            name='mydev', account_number='111222333444',
+            default_region='us-west-2', outputs={'AccountOutput': 'foo'},
+        ),
+    )
+
+
+def _clear_caches():
+    yolo_file._TEMPLATE_STRINGS.clear()
+    yolo_file._RENDER_CACHE.clear()
+
+
+def _time(func, runs, setup=None):
+    timings = []
+    for _ in range(runs):
+        if setup is not None:
+            setup()
+        start = time.time()
+        func()
+        timings.append(time.time() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--services', type=int, default=40)
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    yf = _build_yolo_file(args.services)
+    variables = _variables()
+    num_lines = len(
+        yaml.dump(yf._raw_content, Dumper=yaml.RoundTripDumper).splitlines()
+    )
+    print('yolo file: {} services, {} lines'.format(args.services, num_lines))
+
+    # Both ways must produce the same result:
+    expected = yf._render_document(**variables)._raw_content
+    _clear_caches()
+    if yf.render(**variables)._raw_content != expected:
+        print('Rendered contents differ!')
+        sys.exit(1)
+
+    def fresh_file():
+        # Clear caches, including the per-instance template analysis.
+        _clear_caches()
+        yf._variable_paths = yolo_file._NOT_ANALYZED
+        yf._content_hash = None
+
+    timings = [
+        ('document', _time(
+            lambda: yf._render_document(**variables), args.runs
+        )),
+        ('compiled (cold)', _time(
+            lambda: yf.render(**variables), args.runs, setup=fresh_file
+        )),
+        ('compiled (memoized)', _time(
+            lambda: yf.render(**variables), args.runs
+        )),
+    ]
+    baseline = timings[0][1]
+    for name, timing in timings:
+        print('{:<22} {:>8.1f}ms {:>7.1f}x'.format(
+            name, timing * 1000, baseline / timing
+        ))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+# Copyright 2017 Rackspace US, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Measure `yolo` CLI startup time and check it against a budget.
+
+Each scenario is run in a fresh interpreter a number of times; the median
+wall time minus the median time of an empty interpreter is reported as the
+import overhead. Exits non-zero if any scenario exceeds its budget.
+
+Usage:
+
+    python benchmarks/startup.py [--runs N] [--no-budget]
+"""
+from __future__ import print_function
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# (name, python code, budget in seconds of import overhead)
+SCENARIOS = [
+    (
+        'yolo --help',
+        "import sys; sys.argv = ['yolo', '--help']\n"
+        "from yolo.script import cli\n"
+        "try:\n"
+        "    cli()\n"
+        "except SystemExit:\n"
+        "    pass\n",
+        0.25,
+    ),
+    (
+        # Everything `yolo show-outputs` has to import before making its
+        # first API call.
+        'yolo show-outputs (imports)',
+        'import yolo.script, yolo.client',
+        1.0,
+    ),
+]
+
+
+def _median(values):
+    values = sorted(values)
+    middle = len(values) // 2
+    if len(values) % 2:
+        return values[middle]
+    return (values[middle - 1] + values[middle]) / 2.0
+
+
+def _time_python(code, runs):
+    env = os.environ.copy()
+    env['PYTHONPATH'] = REPO_ROOT + os.pathsep + env.get('PYTHONPATH', '')
+    timings = []
+    with open(os.devnull, 'w') as devnull:
+        for _ in range(runs):
+            start = time.time()
+            subprocess.check_call(
+                [sys.executable, '-c', code], env=env, stdout=devnull,
+            )
+            timings.append(time.time() - start)
+    return _median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument(
+        '--no-budget', action='store_true',
+        help="Only report timings; don't fail when over budget.",
+    )
+    args = parser.parse_args()
+
+    baseline = _time_python('pass', args.runs)
+    print('{:<30} {:>10} {:>10}'.format('Scenario', 'Overhead', 'Budget'))
+    over_budget = []
+    for name, code, budget in SCENARIOS:
+        overhead = _time_python(code, args.runs) - baseline
+        print('{:<30} {:>9.3f}s {:>9.3f}s'.format(name, overhead, budget))
+        if overhead > budget:
+            over_budget.append(name)
+
+    if over_budget and not args.no_budget:
+        print('Over budget: {}'.format(', '.join(over_budget)))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
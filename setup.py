@@ -55,6 +55,7 @@ config = dict(
         'botocore>=1.7.18',
         'click',
         'docker==3.4.0',
+        'futures; python_version < "3"',
         'jinja2',
         'keyring==8.7.0',
         'keyrings.alt',
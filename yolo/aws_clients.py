@@ -0,0 +1,109 @@
+# Copyright 2017 Rackspace US, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import logging
+import threading
+
+import botocore.client
+
+LOG = logging.getLogger(__name__)
+
+
+def _freeze(value):
+    """Turn a client keyword argument value into something hashable."""
+    if isinstance(value, botocore.client.Config):
+        # Configs don't implement equality, so compare the options the user
+        # actually set.
+        return ('Config', _freeze(value._user_provided_options))
+    elif isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    elif isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+
+class ClientRegistry(object):
+    """Registry of botocore clients, keyed by account/service/region/config.
+
+    Creating a client means loading and parsing the service model, which is
+    surprisingly expensive. Clients are safe to share between threads, so we
+    only ever need to build one per account, service, region and config.
+
+    The ``built`` and ``reused`` counters show how many clients were actually
+    created versus handed back from the registry.
+    """
+
+    def __init__(self):
+        self.built = 0
+        self.reused = 0
+        self._clients = {}
+        # Guards ``_clients``, ``_build_locks`` and the counters; never held
+        # while building a client.
+        self._lock = threading.Lock()
+        # boto3 sessions are not thread-safe, so client creation needs to be
+        # serialized per session (i.e., per account). Clients for different
+        # accounts can be built concurrently.
+        self._build_locks = {}
+
+    @property
+    def stats(self):
+        return dict(built=self.built, reused=self.reused)
+
+    def get_client(self, session, acct_num, aws_service, region_name=None,
+                   **kwargs):
+        """Get a client, building it from ``session`` if necessary.
+
+        :param session:
+            :class:`boto3.session.Session` for the account ``acct_num``.
+        :param str acct_num:
+            AWS account number.
+        :param str aws_service:
+            Name of the AWS service (e.g., 'cloudformation', 's3').
+        :param str region_name:
+            AWS region name.
+        :param kwargs:
+            Additional keyword arguments for
+            :meth:`boto3.session.Session.client` (such as ``config``).
+        """
+        key = (
+            acct_num,
+            aws_service,
+            region_name,
+            tuple(sorted((k, _freeze(v)) for k, v in kwargs.items())),
+        )
+        with self._lock:
+            client = self._clients.get(key)
+            if client is not None:
+                self.reused += 1
+                return client
+            build_lock = self._build_locks.setdefault(
+                acct_num, threading.Lock()
+            )
+
+        with build_lock:
+            with self._lock:
+                # Another thread may have built it while we were waiting.
+                client = self._clients.get(key)
+                if client is not None:
+                    self.reused += 1
+                    return client
+            LOG.debug('Building %s client for account %s (%s)',
+                      aws_service, acct_num, region_name)
+            client = session.client(
+                aws_service, region_name=region_name, **kwargs
+            )
+            with self._lock:
+                self._clients[key] = client
+                self.built += 1
+        return client
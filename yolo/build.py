@@ -1,14 +1,33 @@
+import fnmatch
+import glob
 import io
 import logging
 import os
+import posixpath
+try:
+    import queue
+except ImportError:
+    # Python2 fallback
+    import Queue as queue
 import tarfile
+import threading
 import time
 
+import yolo.exceptions
+
 LOG = logging.getLogger(__name__)
 
 CONTAINER_POLL_INTERVAL = 10
 FEEDBACK_IN_SECONDS = 60
 STATUS_EXITED = 'exited'
+# Tar archives are streamed to containers in chunks of this many bytes, with
+# at most this many chunks buffered.
+TAR_CHUNK_SIZE = 64 * 1024
+TAR_QUEUE_SIZE = 16
+_END_OF_TAR = object()
+# Patterns for files to leave out of the build context, see `is_ignored`.
+IGNORE_FILE = '.yoloignore'
+MB = 1024.0 * 1024
 
 
 def wait_for_container_to_finish(container):
@@ -43,17 +62,216 @@ def remove_container(container, **kwargs):
         )
 
 
+class _Cancelled(Exception):
+    """The consumer of a tar stream has gone away."""
+
+
+class _ChunkWriter(object):
+    """File-like object which hands what's written to it to a queue, in
+    chunks of ``TAR_CHUNK_SIZE`` bytes."""
+
+    def __init__(self, chunks, cancelled):
+        self._chunks = chunks
+        self._cancelled = cancelled
+        self._buffer = bytearray()
+
+    def write(self, data):
+        self._buffer.extend(data)
+        while len(self._buffer) >= TAR_CHUNK_SIZE:
+            self.put(bytes(self._buffer[:TAR_CHUNK_SIZE]))
+            del self._buffer[:TAR_CHUNK_SIZE]
+
+    def flush(self):
+        if self._buffer:
+            self.put(bytes(self._buffer))
+            del self._buffer[:]
+
+    def put(self, item):
+        # Block while the queue is full, unless the consumer is gone.
+        while True:
+            if self._cancelled.is_set():
+                raise _Cancelled()
+            try:
+                self._chunks.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+
+def iter_tar(members, tar_filter=None):
+    """Generate a tar archive, chunk by chunk.
+
+    The archive is written by a background thread, so that it can be
+    consumed (e.g., sent to the Docker daemon) while it's being built. At
+    most ``TAR_QUEUE_SIZE`` chunks are held in memory at any time.
+
+    :param members:
+        List of ``(path, arcname, recursive)`` tuples to add to the archive.
+    :param tar_filter:
+        (Optional.) Function which takes a :class:`tarfile.TarInfo` and
+        returns it (or a modified one), or ``None`` to leave it out (see
+        :meth:`tarfile.TarFile.add`).
+    """
+    chunks = queue.Queue(maxsize=TAR_QUEUE_SIZE)
+    cancelled = threading.Event()
+
+    def write_tar():
+        writer = _ChunkWriter(chunks, cancelled)
+        try:
+            try:
+                with tarfile.open(fileobj=writer, mode='w|') as tar:
+                    for path, arcname, recursive in members:
+                        tar.add(
+                            path, arcname=arcname, recursive=recursive,
+                            filter=tar_filter,
+                        )
+                writer.flush()
+            except _Cancelled:
+                return
+            except Exception as exc:
+                writer.put(exc)
+            else:
+                writer.put(_END_OF_TAR)
+        except _Cancelled:
+            pass
+
+    thread = threading.Thread(target=write_tar)
+    thread.daemon = True
+    thread.start()
+    try:
+        while True:
+            chunk = chunks.get()
+            if chunk is _END_OF_TAR:
+                break
+            elif isinstance(chunk, Exception):
+                raise chunk
+            yield chunk
+    finally:
+        cancelled.set()
+        thread.join()
+
+
 def put_files(container, src_dir, path, single_file_name=None):
-    stream = io.BytesIO()
+    if single_file_name:
+        arcname = single_file_name
+    else:
+        arcname = "/"
+    container.put_archive(
+        data=iter_tar([(src_dir, arcname, True)]), path=path
+    )
 
-    with tarfile.open(fileobj=stream, mode='w') as tar:
-        if single_file_name:
-            arcname = single_file_name
-        else:
-            arcname = "/"
-        tar.add(src_dir, arcname=arcname)
-    stream.seek(0)
-    container.put_archive(data=stream, path=path)
+
+def read_ignore_file(path):
+    """Read ignore patterns (e.g., from a ``.yoloignore`` file).
+
+    One pattern per line; blank lines and lines starting with ``#`` are
+    skipped. See :func:`is_ignored` for how patterns are matched.
+
+    :returns:
+        `list` of patterns (empty if the file doesn't exist).
+    """
+    if not os.path.isfile(path):
+        return []
+    with open(path) as fp:
+        lines = (line.strip() for line in fp)
+        return [line for line in lines if line and not line.startswith('#')]
+
+
+def is_ignored(rel_path, is_dir, patterns):
+    """Check if a path matches any of the ignore patterns.
+
+    Patterns are shell-style wildcards (see :mod:`fnmatch`), similar to
+    ``.gitignore`` patterns:
+
+    - ``*.pyc`` (no slash) matches a file or directory with that name
+      anywhere.
+    - ``docs/build`` or ``/build`` (with a slash) matches a path relative to
+      the working directory.
+    - ``build/`` (trailing slash) only matches directories.
+
+    Nothing inside of an ignored directory is included either.
+
+    :param str rel_path:
+        Path relative to the working directory, using forward slashes.
+    :param bool is_dir:
+        ``True`` if the path is a directory.
+    :param list patterns:
+        Patterns, see :func:`read_ignore_file`.
+    """
+    name = rel_path.rsplit('/', 1)[-1]
+    for pattern in patterns:
+        if pattern.endswith('/'):
+            if not is_dir:
+                continue
+            pattern = pattern.rstrip('/')
+        if '/' in pattern:
+            if fnmatch.fnmatch(rel_path, pattern.lstrip('/')):
+                return True
+        elif fnmatch.fnmatch(name, pattern):
+            return True
+    return False
+
+
+def put_build_context(container, working_dir, include, path):
+    """Copy the files to build from into a container.
+
+    Only the ``include`` entries of ``working_dir`` are copied, leaving out
+    anything that matches the patterns in ``working_dir/.yoloignore``.
+
+    :param container:
+        :class:`docker.models.containers.Container` instance.
+    :param str working_dir:
+        Directory to build from.
+    :param list include:
+        Files and directories (relative to ``working_dir``) to copy. Shell
+        wildcards are expanded.
+    :param str path:
+        Location in the container to copy the files to.
+    """
+    patterns = read_ignore_file(os.path.join(working_dir, IGNORE_FILE))
+
+    members = []
+    seen = set()
+    for entry in include:
+        matches = sorted(glob.glob(os.path.join(working_dir, entry)))
+        if not matches:
+            LOG.warning('"%s" does not match any files in %s',
+                        entry, working_dir)
+        for match in matches:
+            arcname = os.path.relpath(match, working_dir).replace(os.sep, '/')
+            if arcname == '..' or arcname.startswith('../'):
+                raise yolo.exceptions.YoloError(
+                    '"{}" is outside of {}'.format(entry, working_dir)
+                )
+            # Add parent directories first, so that they are created with
+            # the right permissions.
+            parts = arcname.split('/')
+            for i in range(1, len(parts) + 1):
+                member_arcname = '/'.join(parts[:i])
+                if member_arcname not in seen:
+                    seen.add(member_arcname)
+                    members.append((
+                        os.path.join(working_dir, *parts[:i]),
+                        member_arcname,
+                        i == len(parts),
+                    ))
+
+    context = dict(size=0, num_files=0)
+
+    def tar_filter(tarinfo):
+        rel_path = posixpath.normpath(tarinfo.name)
+        if is_ignored(rel_path, tarinfo.isdir(), patterns):
+            return None
+        if tarinfo.isfile():
+            context['size'] += tarinfo.size
+            context['num_files'] += 1
+        return tarinfo
+
+    container.put_archive(data=iter_tar(members, tar_filter), path=path)
+    LOG.warning(
+        'Build context: %d files, %.1f MB',
+        context['num_files'], context['size'] / MB,
+    )
 
 
 def create_build_volume_container(docker_client,
@@ -61,7 +279,8 @@ def create_build_volume_container(docker_client,
                                   working_dir=None,
                                   dependencies_path=None,
                                   dist_dir=None,
-                                  build_cache_dir=None):
+                                  build_cache_dir=None,
+                                  include=None):
     docker_client.images.pull(image)
     working_dir_volume = docker_client.volumes.create()
     dependencies_volume = docker_client.volumes.create()
@@ -75,7 +294,11 @@ def create_build_volume_container(docker_client,
                            "{}:/dist".format(dist_dir_volume.name),
                            "{}:/build_cache".format(build_cache_volume.name)
                          ])
-    put_files(volume_container, working_dir, "/src")
+    if include:
+        # Only the included files end up in the build.
+        put_build_context(volume_container, working_dir, include, "/src")
+    else:
+        put_files(volume_container, working_dir, "/src")
     put_files(volume_container, dependencies_path, "/dependencies",
               single_file_name="requirements.txt")
     if os.path.isdir(build_cache_dir):
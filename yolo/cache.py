@@ -0,0 +1,84 @@
+# Copyright 2017 Rackspace US, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import logging
+import os
+import re
+import tempfile
+import time
+
+LOG = logging.getLogger(__name__)
+
+# Python 2 doesn't have `os.replace`.
+_replace = getattr(os, 'replace', os.rename)
+
+
+class FileCache(object):
+    """Cache JSON-serializable values in files in a local directory.
+
+    Each entry is stored in its own file, named after the cache key. Entries
+    older than ``ttl`` seconds are ignored.
+    """
+
+    def __init__(self, cache_dir, ttl=None):
+        """
+        :param str cache_dir:
+            Directory to store cache entries in. It is created on demand.
+        :param ttl:
+            Time-to-live of cache entries, in seconds. ``None`` means entries
+            never expire.
+        """
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+
+    def _path(self, key):
+        # Keep file names portable.
+        filename = re.sub(r'[^A-Za-z0-9_.-]', '_', key) + '.json'
+        return os.path.join(self.cache_dir, filename)
+
+    def get(self, key):
+        """Get a cached value, or ``None`` if it is missing or expired."""
+        try:
+            with open(self._path(key)) as fp:
+                entry = json.load(fp)
+        except (IOError, OSError, ValueError):
+            # Missing or corrupt entry
+            return None
+        if self.ttl is not None and entry['cached_at'] + self.ttl <= time.time():
+            LOG.info('Cache entry "%s" has expired', key)
+            return None
+        return entry['value']
+
+    def set(self, key, value):
+        entry = dict(cached_at=time.time(), value=value)
+        try:
+            if not os.path.isdir(self.cache_dir):
+                os.makedirs(self.cache_dir)
+            # Write to a temp file first and move it into place, so that
+            # concurrent readers never see a partially written entry.
+            fd, temp_path = tempfile.mkstemp(dir=self.cache_dir)
+            with os.fdopen(fd, 'w') as fp:
+                json.dump(entry, fp, separators=(',', ':'))
+            _replace(temp_path, self._path(key))
+        except (IOError, OSError) as exc:
+            # Caching is only an optimization; don't fail the command.
+            LOG.warning('Unable to write cache entry "%s": %s', key, exc)
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except (IOError, OSError):
+            # Nothing was cached.
+            pass
@@ -15,30 +15,27 @@
 from __future__ import print_function
 
 import code
+from concurrent import futures
 import datetime
 import getpass
+import importlib
+import io
 import json
 import logging
 import subprocess
 import os
 import sys
 import tempfile
+import threading
+import time
 
 import botocore.exceptions
 import botocore.session
-try:
-    import bpython
-    have_bpython = True
-except ImportError:
-    have_bpython = False
-try:
-    from IPython import start_ipython
-    have_ipython = True
-except ImportError:
-    have_ipython = False
 import keyring
 import tabulate
 
+from yolo.cache import FileCache
+from yolo import cloudformation
 from yolo.cloudformation import CloudFormation
 from yolo import const
 from yolo.credentials.aws_cli import AWSCLICredentials
@@ -47,9 +44,8 @@ from yolo.exceptions import NoInfrastructureError
 from yolo.exceptions import StackDoesNotExist
 from yolo.exceptions import YoloError
 from yolo import faws_client
-from yolo.services import lambda_service
-from yolo.services import s3_service
 from yolo.utils import get_version_hash
+from yolo.waiter import VerboseCloudFormationWaiter
 from yolo import utils
 from yolo.yolo_file import YoloFile
 
@@ -71,13 +67,41 @@ logging.getLogger('lambda_uploader').setLevel(logging.CRITICAL)
 
 LOG = logging.getLogger(__name__)
 
+# Buckets are checked for/created by concurrent deployments, too.
+_ENSURE_BUCKET_LOCK = threading.Lock()
+
+# Service classes are imported lazily (see `get_service_class`); some of them
+# pull in heavy dependencies, like the Docker client.
 SERVICE_TYPE_MAP = {
-    YoloFile.SERVICE_TYPE_LAMBDA: lambda_service.LambdaService,
-    YoloFile.SERVICE_TYPE_LAMBDA_APIGATEWAY: lambda_service.LambdaService,
-    YoloFile.SERVICE_TYPE_S3: s3_service.S3Service,
+    YoloFile.SERVICE_TYPE_LAMBDA: 'yolo.services.lambda_service.LambdaService',
+    YoloFile.SERVICE_TYPE_LAMBDA_APIGATEWAY: (
+        'yolo.services.lambda_service.LambdaService'
+    ),
+    YoloFile.SERVICE_TYPE_S3: 'yolo.services.s3_service.S3Service',
 }
 
 
+def get_service_class(service_type):
+    """Import and return the service class for a given service type.
+
+    :param str service_type:
+        One of :attr:`yolo.yolo_file.YoloFile.SERVICE_TYPES`.
+    """
+    module_name, class_name = SERVICE_TYPE_MAP[service_type].rsplit('.', 1)
+    module = importlib.import_module(module_name)
+    return getattr(module, class_name)
+
+
+def _check_deploy_mode(dry_run, plan, apply, recreate):
+    """Make sure that the `deploy-infra` options go together."""
+    if dry_run + plan + apply > 1:
+        raise YoloError(
+            'Only one of --dry-run, --plan and --apply can be used at a time.'
+        )
+    if recreate and (plan or apply):
+        raise YoloError('--recreate cannot be used with --plan or --apply.')
+
+
 class FakeYokeArgs(object):
 
     def __init__(self, func, config):
@@ -87,11 +111,19 @@ class FakeYokeArgs(object):
 
 class YoloClient(object):
 
-    def __init__(self, yolo_file=None):
+    def __init__(self, yolo_file=None, use_cache=True):
         self._yolo_file_path = yolo_file
         self._yolo_file = None
         self._faws_client = None
 
+        # Set to ``False`` to ignore locally cached data (like stack outputs).
+        self.use_cache = use_cache
+        self._outputs_cache = None
+        # Stack snapshots by (account number, region), see
+        # `get_stack_snapshot`.
+        self._stack_snapshots = {}
+        self._stack_snapshots_lock = threading.Lock()
+
         # Credentials for accessing FAWS accounts:
         self._rax_username = None
         self._rax_api_key = None
@@ -161,6 +193,34 @@ class YoloClient(object):
             self._yolo_file = self._get_yolo_file(self._yolo_file_path)
         return self._yolo_file
 
+    @property
+    def yolo_dir(self):
+        """Directory for local state/caches, next to the yolo.yaml file."""
+        # Make sure the path to the yolo file has been resolved:
+        self.yolo_file
+        return os.path.join(
+            os.path.dirname(self._yolo_file_path), const.YOLO_DIR
+        )
+
+    @property
+    def outputs_cache(self):
+        """Local cache of stack outputs, or ``None`` if caching is disabled.
+
+        Stack outputs only change when infrastructure is deployed, so there's
+        no need to fetch them again for every command.
+        """
+        if not self.use_cache:
+            return None
+        if self._outputs_cache is None:
+            ttl = int(
+                os.getenv(const.OUTPUTS_CACHE_TTL) or
+                const.DEFAULT_OUTPUTS_CACHE_TTL
+            )
+            self._outputs_cache = FileCache(
+                os.path.join(self.yolo_dir, 'cache', 'outputs'), ttl=ttl
+            )
+        return self._outputs_cache
+
     @property
     def faws_client(self):
         """Lazily instantiate a FAWS client."""
@@ -221,31 +281,83 @@ class YoloClient(object):
         )
 
     def _get_service_cfg(self, service):
-        service_cfg = self.yolo_file.services.get(service)
-        if service_cfg is None:
-            raise YoloError(
-                'Unknown service "{service}". Valid services: '
-                '{services}.'.format(
-                    service=service,
-                    services=', '.join(sorted(self.yolo_file.services.keys())),
-                )
-            )
-        return service_cfg
+        return self.yolo_file.get_service(service).config
 
     def _get_service_client(self, service):
         service_cfg = self._get_service_cfg(service)
-        service_client = SERVICE_TYPE_MAP[service_cfg['type']](
+        service_client = get_service_class(service_cfg['type'])(
             self.yolo_file, self.faws_client, self.context
             # TODO: add timeout
         )
         return service_client
 
+    def _get_outputs_cache_key(self, region, stack_name):
+        # Stack names already include the account number.
+        return '{}-{}'.format(region, stack_name)
+
+    def get_stack_outputs(self, account_number, region, stack_name):
+        """Get the outputs of a stack, preferably from the local cache.
+
+        :raises:
+            :class:`yolo.exceptions.StackDoesNotExist` if the stack doesn't
+            exist.
+        """
+        cache_key = self._get_outputs_cache_key(region, stack_name)
+        if self.outputs_cache is not None:
+            outputs = self.outputs_cache.get(cache_key)
+            if outputs is not None:
+                return outputs
+
+        outputs = self.get_stack_snapshot(
+            account_number, region
+        ).get_stack_outputs(stack_name)
+        if self.outputs_cache is not None:
+            self.outputs_cache.set(cache_key, outputs)
+        return outputs
+
+    def get_stack_snapshot(self, account_number, region):
+        """Get the stacks of an account/region, described once each.
+
+        The snapshot is shared by all lookups in this command (and with
+        worker clients). Deployed stacks are dropped from it.
+
+        :returns:
+            :class:`yolo.cloudformation.StackSnapshot` instance.
+        """
+        key = (account_number, region)
+        with self._stack_snapshots_lock:
+            snapshot = self._stack_snapshots.get(key)
+            if snapshot is None:
+                snapshot = cloudformation.StackSnapshot(
+                    self.faws_client.aws_client(
+                        account_number, 'cloudformation', region
+                    )
+                )
+                self._stack_snapshots[key] = snapshot
+        return snapshot
+
+    def _invalidate_stack_outputs(self, region, stack_name):
+        """Drop cached outputs of a stack which is being created/updated.
+
+        The stack is dropped from the stack snapshots of the region as well.
+        """
+        with self._stack_snapshots_lock:
+            snapshots = [
+                snapshot
+                for key, snapshot in self._stack_snapshots.items()
+                if key[1] == region
+            ]
+        for snapshot in snapshots:
+            snapshot.forget(stack_name)
+        if self.outputs_cache is not None:
+            self.outputs_cache.delete(
+                self._get_outputs_cache_key(region, stack_name)
+            )
+
     def get_stage_outputs(self, account_number, region, stage):
-        cf_client = self.faws_client.aws_client(account_number, 'cloudformation', region)
-        cf = CloudFormation(cf_client)
         stack_name = self.get_stage_stack_name(account_number, stage)
         try:
-            return cf.get_stack_outputs(stack_name=stack_name)
+            return self.get_stack_outputs(account_number, region, stack_name)
         except StackDoesNotExist:
             raise YoloError(
                 'Stage infrastructure stack does not exist; please run '
@@ -253,14 +365,12 @@ class YoloClient(object):
             )
 
     def get_account_outputs(self, account_number, region):
-        cf_client = self.faws_client.aws_client(account_number, 'cloudformation', region)
-        cf = CloudFormation(cf_client)
         stack_name = self.get_account_stack_name(account_number)
         # Full account-level data might not be available, when the baseline
         # stack doesn't exist. We should only allow this to happen, when there's
         # no baseline infrastructure defined.
         try:
-            return cf.get_stack_outputs(stack_name=stack_name)
+            return self.get_stack_outputs(account_number, region, stack_name)
         except StackDoesNotExist:
             LOG.info(
                 'Account-level stack does not exist yet for account %s,',
@@ -293,63 +403,68 @@ class YoloClient(object):
             account={'outputs': {}, 'account_number': None, 'name': None},
         )
         if stage is not None:
-            stage_cfg = self.yolo_file.get_stage_config(stage)
-            account_cfg = self.yolo_file.normalize_account(
-                stage_cfg['account']
-            )
+            stage_obj = self.yolo_file.get_stage(stage)
+            account_cfg = stage_obj.account
+            account_context = self._get_account_context(account_cfg)
 
-            # Account templates are optional:
-            if 'account' in self.yolo_file.templates:
-                # get account stack outputs
-                account_stack_outputs = self.get_account_outputs(
-                    account_cfg.account_number,
-                    account_cfg.default_region,
-                )
-            else:
-                account_stack_outputs = {}
-
-            account_context = utils.DottedDict(
-                name=account_cfg.name,
-                account_number=account_cfg.account_number,
-                outputs=account_stack_outputs,
-                default_region=account_cfg.default_region,
-            )
+            def get_stage_outputs():
+                try:
+                    return self.get_stage_outputs(
+                        account_cfg.account_number, stage_obj.region, stage
+                    )
+                except YoloError:
+                    # The stack for this stage doesn't exist (at least, not
+                    # yet).
+                    return {}
 
-            # get stage stack outputs
-            try:
-                stage_stack_outputs = self.get_stage_outputs(
-                    account_cfg.account_number, stage_cfg['region'], stage
-                )
-            except YoloError:
-                # The stack for this stage doesn't exist (at least, not yet).
-                stage_stack_outputs = {}
             stage_context = utils.DottedDict(
                 name=stage,
-                region=stage_cfg['region'],
-                outputs=stage_stack_outputs,
+                region=stage_obj.region,
+                outputs=utils.LazyMapping(get_stage_outputs),
             )
 
             context['stage'] = stage_context
             context['account'] = account_context
+
+            # Stack outputs are only looked up when they are actually used.
+            # If the yolo file needs both, look them up at the same time; the
+            # account and stage stacks are often in different regions.
+            referenced = self.yolo_file.get_referenced_outputs()
+            if referenced == {'stage', 'account'}:
+                with futures.ThreadPoolExecutor(max_workers=2) as executor:
+                    for outputs in (account_context.outputs,
+                                    stage_context.outputs):
+                        executor.submit(outputs.load)
         else:
             if account is not None:
                 account_cfg = self.yolo_file.normalize_account(account)
-
-                # get account stack outputs
-                account_stack_outputs = self.get_account_outputs(
-                    account_cfg.account_number,
-                    account_cfg.default_region,
-                )
-                account_context = utils.DottedDict(
-                    name=account_cfg.name,
-                    account_number=account_cfg.account_number,
-                    outputs=account_stack_outputs,
-                    default_region=account_cfg.default_region,
-                )
-                context['account'] = account_context
+                context['account'] = self._get_account_context(account_cfg)
 
         self._context = context
 
+    def _get_account_context(self, account_cfg):
+        """Build the ``account`` part of the yolofile context.
+
+        Account stack outputs are only looked up when they are accessed.
+
+        :param account_cfg:
+            :class:`yolo.yolo_file.AWSAccount` instance.
+        """
+        def get_account_outputs():
+            # Account templates are optional:
+            if 'account' not in self.yolo_file.templates:
+                return {}
+            return self.get_account_outputs(
+                account_cfg.account_number, account_cfg.default_region
+            )
+
+        return utils.DottedDict(
+            name=account_cfg.name,
+            account_number=account_cfg.account_number,
+            outputs=utils.LazyMapping(get_account_outputs),
+            default_region=account_cfg.default_region,
+        )
+
     def get_stage_stack_name(self, account_number, stage):
         return '{}-{}-{}'.format(
             self.yolo_file.app_name,
@@ -370,7 +485,7 @@ class YoloClient(object):
     def _setup_aws_credentials_in_environment(self, acct_num, region):
         os.environ['AWS_DEFAULT_REGION'] = region
         aws_session = self.faws_client.boto3_session(acct_num)
-        credentials = aws_session.get_credentials()
+        credentials = aws_session.get_credentials().get_frozen_credentials()
         os.environ['AWS_ACCESS_KEY_ID'] = credentials.access_key
         os.environ['AWS_SECRET_ACCESS_KEY'] = credentials.secret_key
         if credentials.token:
@@ -396,7 +511,13 @@ class YoloClient(object):
             config_path = os.path.abspath(yolo_file)
 
         self._yolo_file_path = config_path
-        yf = YoloFile.from_path(self._yolo_file_path)
+        if self.use_cache:
+            cache = FileCache(os.path.join(
+                os.path.dirname(config_path), const.YOLO_DIR, 'cache'
+            ))
+        else:
+            cache = None
+        yf = YoloFile.from_path(self._yolo_file_path, cache=cache)
         return yf
 
     def _stages_accounts_regions(self, yf, stage):
@@ -426,6 +547,60 @@ class YoloClient(object):
             ])
         return stgs_accts_regions
 
+    def _list_app_stacks(self, account_number, region, stack_names=None):
+        """List the (not deleted) stacks of the app in an account/region.
+
+        :param str account_number:
+            AWS account number.
+        :param str region:
+            AWS region (e.g., us-east-1, eu-west-1, etc.).
+        :param stack_names:
+            (Optional.) Only list stacks with these names. By default, all
+            stacks with names starting with the app name are listed.
+
+        :returns:
+            `list` of stack summaries, as returned by ``list_stacks``.
+        """
+        cf_client = self.faws_client.aws_client(
+            account_number, 'cloudformation', region_name=region
+        )
+        stacks = []
+        stacks_paginator = cf_client.get_paginator('list_stacks')
+        for page in stacks_paginator.paginate(
+            StackStatusFilter=const.ACTIVE_STACK_STATUSES
+        ):
+            for stack in page['StackSummaries']:
+                if stack_names is None:
+                    if stack['StackName'].startswith(self.yolo_file.app_name):
+                        stacks.append(stack)
+                elif stack['StackName'] in stack_names:
+                    stacks.append(stack)
+        return stacks
+
+    def _prefetch_sessions(self, account_numbers):
+        """Fetch credentials and sessions for several accounts concurrently.
+
+        Commands which touch multiple accounts would otherwise fetch
+        credentials for each account one after the other.
+
+        :param account_numbers:
+            Iterable of AWS account numbers.
+        """
+        account_numbers = set(account_numbers)
+        if len(account_numbers) < 2:
+            # Nothing to gain here.
+            return
+        with futures.ThreadPoolExecutor(
+            max_workers=min(len(account_numbers), const.MAX_WORKERS)
+        ) as executor:
+            session_futures = [
+                executor.submit(self.faws_client.boto3_session, acct_num)
+                for acct_num in account_numbers
+            ]
+        for future in session_futures:
+            # Re-raise errors, if there were any.
+            future.result()
+
     def _ensure_bucket(self, acct_num, region, bucket_name):
         """Make sure an S3 bucket exists in the specified account/region.
 
@@ -445,34 +620,124 @@ class YoloClient(object):
         s3_client = self.faws_client.aws_client(
             acct_num, 's3', region_name=region
         )
-        try:
-            print('checking for bucket {}...'.format(bucket_name))
-            s3_client.head_bucket(Bucket=bucket_name)
-        except botocore.exceptions.ClientError as err:
-            print('bucket "{}" does not exist.  creating...'.format(
-                bucket_name)
-            )
-            if str(err) == const.BUCKET_NOT_FOUND:
-                create_bucket_kwargs = {
-                    'ACL': 'private',
-                    'Bucket': bucket_name,
-                }
-                if not region == 'us-east-1':
-                    # You can only specify a location constraint for regions
-                    # which are not us-east-1. For us-east-1, you just don't
-                    # specify anything--which is kind of silly.
-                    create_bucket_kwargs['CreateBucketConfiguration'] = {
-                        'LocationConstraint': region
+        with _ENSURE_BUCKET_LOCK:
+            try:
+                print('checking for bucket {}...'.format(bucket_name))
+                s3_client.head_bucket(Bucket=bucket_name)
+            except botocore.exceptions.ClientError as err:
+                print('bucket "{}" does not exist.  creating...'.format(
+                    bucket_name)
+                )
+                if str(err) == const.BUCKET_NOT_FOUND:
+                    create_bucket_kwargs = {
+                        'ACL': 'private',
+                        'Bucket': bucket_name,
                     }
-                s3_client.create_bucket(**create_bucket_kwargs)
-        s3 = self.faws_client.boto3_session(acct_num).resource('s3', region_name=region)
+                    if not region == 'us-east-1':
+                        # You can only specify a location constraint for
+                        # regions which are not us-east-1. For us-east-1, you
+                        # just don't specify anything--which is kind of silly.
+                        create_bucket_kwargs['CreateBucketConfiguration'] = {
+                            'LocationConstraint': region
+                        }
+                    s3_client.create_bucket(**create_bucket_kwargs)
+            # boto3 sessions are not thread-safe.
+            s3 = self.faws_client.boto3_session(acct_num).resource(
+                's3', region_name=region
+            )
         bucket = s3.Bucket(bucket_name)
         return bucket
 
+    def _upload_templates(self, bucket, templates):
+        """Upload CloudFormation templates which aren't in S3 yet.
+
+        Existing objects are checked for and the missing ones are uploaded
+        concurrently (up to ``const.MAX_WORKERS`` at a time), through a single
+        S3 transfer manager.
+
+        :param bucket:
+            :class:`boto3.resources.factory.s3.Bucket` instance.
+        :param dict templates:
+            File name -> (S3 key, contents to upload), see
+            :func:`yolo.cloudformation.address_templates_by_content`.
+
+        :raises:
+            :class:`yolo.exceptions.YoloError` if any of the uploads failed,
+            after all others have completed.
+        """
+        from boto3.s3.transfer import TransferConfig
+        from boto3.s3.transfer import create_transfer_manager
+
+        s3_client = bucket.meta.client
+        files = sorted(templates)
+        max_workers = min(len(files), const.MAX_WORKERS)
+        with futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+            exists = dict(zip(files, executor.map(
+                lambda f: self._s3_object_exists(bucket, templates[f][0]),
+                files,
+            )))
+        to_upload = [f for f in files if not exists[f]]
+        print('{} of {} templates are up to date.'.format(
+            len(files) - len(to_upload), len(files)
+        ))
+        if not to_upload:
+            return
+
+        started_at = time.time()
+        errors = []
+        transfer_config = TransferConfig(max_concurrency=max_workers)
+        with create_transfer_manager(s3_client, transfer_config) as manager:
+            uploads = []
+            for cf_file in to_upload:
+                bucket_key, body = templates[cf_file]
+                print('uploading s3://{}/{}...'.format(bucket.name, bucket_key))
+                uploads.append((cf_file, manager.upload(
+                    io.BytesIO(body), bucket.name, bucket_key,
+                    extra_args=const.S3_UPLOAD_EXTRA_ARGS,
+                )))
+            for cf_file, upload in uploads:
+                try:
+                    upload.result()
+                except Exception as exc:
+                    errors.append((cf_file, exc))
+        elapsed = time.time() - started_at
+
+        if errors:
+            raise YoloError(
+                'Failed to upload {} of {} templates:\n{}'.format(
+                    len(errors), len(to_upload), '\n'.join(
+                        '  {}: {}'.format(cf_file, exc)
+                        for cf_file, exc in errors
+                    )
+                )
+            )
+        total_bytes = sum(len(templates[f][1]) for f in to_upload)
+        print('uploaded {} templates ({:.1f} KiB) in {:.2f}s ({:.1f} KiB/s).'.format(
+            len(to_upload), total_bytes / 1024.0, elapsed,
+            total_bytes / 1024.0 / max(elapsed, 0.001),
+        ))
+
+    @staticmethod
+    def _s3_object_exists(bucket, key):
+        """Check if an object exists in an S3 bucket.
+
+        :param bucket:
+            :class:`boto3.resources.factory.s3.Bucket` instance.
+        :param str key:
+            Key of the object.
+        """
+        try:
+            bucket.meta.client.head_object(Bucket=bucket.name, Key=key)
+        except botocore.exceptions.ClientError as err:
+            if err.response['Error']['Code'] in ('404', 'NoSuchKey'):
+                return False
+            raise
+        return True
+
     def _create_or_update_stack(self, cf_client, stack_name, master_url,
                                 stack_params, tags, asynchronous=False,
                                 dry_run=False, protected=False,
-                                recreate=False):
+                                recreate=False, stack_details=None):
         """Create a new or update an existing stack.
 
         :param cf_client:
@@ -512,52 +777,93 @@ class YoloClient(object):
 
             If ``true``, tear down and re-create the stack from scratch.
             Otherwise, just try to update the existing stack.
+        :param dict stack_details:
+            (Optional.) ``describe_stacks`` response for the stack (or an
+            empty `dict` if it doesn't exist), if it was already looked up.
         """
         if dry_run:
             # Dry run only makes sense for updates, not creates.
             self._update_stack_dry_run(
                 cf_client, stack_name, master_url, stack_params, tags,
+                stack_details=stack_details,
             )
         else:
             self._do_create_or_update_stack(
                 cf_client, stack_name, master_url, stack_params, tags,
                 recreate=recreate, asynchronous=asynchronous,
-                protected=protected,
+                protected=protected, stack_details=stack_details,
             )
 
     def _update_stack_dry_run(self, cf_client, stack_name,
-                              master_url, stack_params, tags):
+                              master_url, stack_params, tags,
+                              stack_details=None):
         """Perform a dry run stack update and output the proposed changes.
 
+        The current template of the stack is fetched while the change set is
+        being created.
+
         :param str stack_name:
             The name of the CloudFormation stack on which to perform a dry run.
         :param str master_url:
             S3 URL where the "master" CloudFormation stack template is located.
+        :param dict stack_details:
+            (Optional.) ``describe_stacks`` response for the stack (or an
+            empty `dict` if it doesn't exist), if it was already looked up.
         """
         cf = CloudFormation(cf_client)
-        stack_exists, stack_details = cf.stack_exists(stack_name)
-        if not stack_exists:
+        if stack_details is None:
+            _, stack_details = cf.stack_exists(stack_name)
+        if not stack_details:
             raise YoloError(
                 'Unable to perform dry run: No stack exists yet.'
             )
+        [stack_desc] = stack_details['Stacks']
 
         LOG.warning('Calculating --dry-run details...')
 
-        result = cf.create_change_set(
-            stack_name, master_url, stack_params, tags
-        )
-        change_set_id = result['Id']
+        with futures.ThreadPoolExecutor(max_workers=1) as executor:
+            current_template = executor.submit(cf.get_template_body, stack_name)
+            result = cf.create_change_set(
+                stack_name, master_url, stack_params,
+                self._get_update_tags(stack_desc, tags),
+            )
+            change_set_id = result['Id']
+            try:
+                self._show_change_set(
+                    cf_client, stack_name, change_set_id, stack_desc,
+                    current_template=current_template.result(),
+                )
+            finally:
+                # Clean up after ourselves; we don't want to leave a bunch of
+                # stale changes sets lying around.
+                cf_client.delete_change_set(
+                    StackName=stack_name, ChangeSetName=change_set_id
+                )
 
-        # Get the full details of the change set:
-        change_set_desc = cf_client.describe_change_set(
-            ChangeSetName=change_set_id,
-            StackName=stack_name,
-        )
+    def _show_change_set(self, cf_client, stack_name, change_set_id,
+                         stack_desc, current_template=None):
+        """Output the changes a change set would make to a stack.
 
-        # Get the current stack details:
-        [stack_desc] = cf_client.describe_stacks(
-            StackName=stack_name
-        )['Stacks']
+        :param dict stack_desc:
+            Description of the stack (from ``describe_stacks``).
+        :param current_template:
+            (Optional.) Current template body of the stack, if it was already
+            fetched.
+        """
+        cf = CloudFormation(cf_client)
+        with futures.ThreadPoolExecutor(max_workers=3) as executor:
+            change_set_desc = executor.submit(
+                cf.describe_change_set, stack_name, change_set_id
+            )
+            new_template = executor.submit(
+                cf.get_template_body, stack_name, change_set_id
+            )
+            if current_template is None:
+                current_template = executor.submit(
+                    cf.get_template_body, stack_name
+                ).result()
+            change_set_desc = change_set_desc.result()
+            new_template = new_template.result()
 
         # Show the changes:
         print('Resource Changes:')
@@ -580,19 +886,167 @@ class YoloClient(object):
         # Show a diff of the full template:
         print('\nTemplate Changes:')
         template_diff = self._get_template_diff(
-            cf_client,
-            dict(StackName=stack_name),
-            dict(StackName=stack_name, ChangeSetName=change_set_id),
+            current_template,
+            new_template,
             fromfile=stack_name,
             tofile='{}-dry-run'.format(stack_name),
         )
         print(template_diff)
 
-        # Clean up after ourselves; we don't want to leave a bunch of stale
-        # changes sets lying around.
-        cf_client.delete_change_set(
-            StackName=stack_name, ChangeSetName=change_set_id
+    @property
+    def plans(self):
+        """Change sets saved by ``deploy-infra --plan``, by stack name."""
+        return FileCache(os.path.join(self.yolo_dir, 'plans'))
+
+    def _plan_stack_update(self, cf_client, stack_name, master_url,
+                           stack_params, tags, fingerprint, stack_details):
+        """Create a change set and save it to be applied later.
+
+        The change set ID is saved in ``.yolo/plans/<stack_name>.json``. If
+        a change set was already planned for the same fingerprint, and it can
+        still be applied, it is shown again instead of creating a new one.
+
+        :param str fingerprint:
+            Fingerprint of the templates, parameters and tags, see
+            :func:`yolo.cloudformation.get_fingerprint`.
+        :param dict stack_details:
+            ``describe_stacks`` response for the stack, or an empty `dict` if
+            the stack doesn't exist.
+
+        For the other parameters, see :meth:`_create_or_update_stack`.
+        """
+        if not stack_details:
+            raise YoloError('Unable to plan changes: No stack exists yet.')
+
+        change_set_id = None
+        saved_plan = self.plans.get(stack_name)
+        if saved_plan is not None:
+            if (self.use_cache and
+                    saved_plan['fingerprint'] == fingerprint and
+                    self._get_change_set_status(
+                        cf_client, stack_name, saved_plan['change_set_id']
+                    ) == 'AVAILABLE'):
+                print('Reusing the change set planned before.')
+                change_set_id = saved_plan['change_set_id']
+            else:
+                # Don't leave stale change sets lying around.
+                self._discard_stack_plan(cf_client, stack_name)
+
+        [stack_desc] = stack_details['Stacks']
+        if change_set_id is None:
+            LOG.warning('Calculating --plan details...')
+            try:
+                # Apply the tags exactly like a direct update would.
+                result = CloudFormation(cf_client).create_change_set(
+                    stack_name, master_url, stack_params,
+                    self._get_update_tags(stack_desc, tags),
+                )
+            except yolo.exceptions.CloudFormationError as err:
+                if "didn't contain changes" in str(err):
+                    print('stack "{}" is up to date, nothing to plan.'.format(
+                        stack_name
+                    ))
+                    return
+                raise
+            change_set_id = result['Id']
+            self.plans.set(stack_name, dict(
+                change_set_id=change_set_id, fingerprint=fingerprint,
+            ))
+
+        self._show_change_set(cf_client, stack_name, change_set_id, stack_desc)
+        print('\nPlan saved. Run `yolo deploy-infra` again with `--apply` to '
+              'apply these changes.')
+
+    def _apply_stack_plan(self, cf_client, stack_name, fingerprint,
+                          asynchronous=False, protected=False):
+        """Execute the change set saved by :meth:`_plan_stack_update`.
+
+        The plan is only applied if the templates, parameters and tags are
+        still the same as when it was made, and CloudFormation can still
+        execute the change set (i.e., the stack hasn't changed in the
+        meantime).
+
+        :param str fingerprint:
+            Fingerprint of the templates, parameters and tags, see
+            :func:`yolo.cloudformation.get_fingerprint`.
+
+        For the other parameters, see :meth:`_create_or_update_stack`.
+        """
+        saved_plan = self.plans.get(stack_name)
+        if saved_plan is None:
+            raise YoloError(
+                'No plan found for stack "{}". Run `yolo deploy-infra` with '
+                '`--plan` first.'.format(stack_name)
+            )
+        if saved_plan['fingerprint'] != fingerprint:
+            self._discard_stack_plan(cf_client, stack_name)
+            raise YoloError(
+                'The templates, parameters or tags for stack "{}" have '
+                'changed since the plan was made. Run `yolo deploy-infra` '
+                'with `--plan` again.'.format(stack_name)
+            )
+        change_set_id = saved_plan['change_set_id']
+        status = self._get_change_set_status(
+            cf_client, stack_name, change_set_id
         )
+        if status != 'AVAILABLE':
+            self.plans.delete(stack_name)
+            raise YoloError(
+                'The plan for stack "{}" can no longer be applied (change set '
+                'status: {}). Run `yolo deploy-infra` with `--plan` '
+                'again.'.format(stack_name, status or 'DELETED')
+            )
+
+        region = cf_client.meta.region_name
+        self._invalidate_stack_outputs(region, stack_name)
+        try:
+            CloudFormation(cf_client).execute_change_set(
+                stack_name, change_set_id,
+                asynchronous=asynchronous, protected=protected,
+            )
+        except botocore.exceptions.ClientError as err:
+            raise YoloError(err)
+        finally:
+            # Executed change sets are gone; either way, the plan is used up.
+            self.plans.delete(stack_name)
+            self._invalidate_stack_outputs(region, stack_name)
+
+    def _discard_stack_plan(self, cf_client, stack_name):
+        """Delete the saved plan of a stack, and its change set."""
+        saved_plan = self.plans.get(stack_name)
+        if saved_plan is not None:
+            self._delete_change_set(
+                cf_client, stack_name, saved_plan['change_set_id']
+            )
+            self.plans.delete(stack_name)
+
+    @staticmethod
+    def _get_change_set_status(cf_client, stack_name, change_set_id):
+        """Get the execution status of a change set.
+
+        :returns:
+            The ``ExecutionStatus`` of the change set (e.g., ``AVAILABLE``),
+            or ``None`` if it doesn't exist (anymore).
+        """
+        try:
+            change_set_desc = cf_client.describe_change_set(
+                ChangeSetName=change_set_id, StackName=stack_name,
+            )
+        except botocore.exceptions.ClientError as err:
+            if 'ChangeSetNotFound' in str(err) or 'does not exist' in str(err):
+                return None
+            raise
+        return change_set_desc['ExecutionStatus']
+
+    @staticmethod
+    def _delete_change_set(cf_client, stack_name, change_set_id):
+        """Delete a change set, if it still exists."""
+        try:
+            cf_client.delete_change_set(
+                StackName=stack_name, ChangeSetName=change_set_id
+            )
+        except botocore.exceptions.ClientError as err:
+            LOG.info('Unable to delete change set "%s": %s', change_set_id, err)
 
     def _get_param_diff(self, stack_a_desc, stack_b_desc):
         """Calculate the diff of params from two CloudFormation stacks.
@@ -645,18 +1099,16 @@ class YoloClient(object):
             a_tags, b_tags, fromfile=fromfile, tofile=tofile
         )
 
-    def _get_template_diff(self, cf_client, a_stack, b_stack, fromfile=None,
+    def _get_template_diff(self, a_template, b_template, fromfile=None,
                            tofile=None):
         """Diff templates used for two different stacks/change sets.
 
-        :param cf_client:
-            boto3 CloudFormation client.
-        :param dict a_stack:
-            Dict containing at least a StackName key (and optionally
-            ChangeSetName).
-        :param dict b_stack:
-            Dict containing at least a StackName key (and optionally
-            ChangeSetName).
+        :param a_template:
+            Template body (as returned by ``get_template``) of the "from"
+            stack/change set.
+        :param b_template:
+            Template body (as returned by ``get_template``) of the "to"
+            stack/change set.
         :param str fromfile:
             Optional "file name" to include in the diff to represent the "from"
             version.
@@ -672,8 +1124,6 @@ class YoloClient(object):
             Note that if the two templates are drastically different (such a
             difference of yaml vs. json), the diff won't be very useful.
         """
-        a_template = cf_client.get_template(**a_stack)['TemplateBody']
-        b_template = cf_client.get_template(**b_stack)['TemplateBody']
         return utils.get_unified_diff(
             a_template, b_template, fromfile=fromfile, tofile=tofile,
         )
@@ -681,14 +1131,20 @@ class YoloClient(object):
     def _do_create_or_update_stack(self, cf_client, stack_name, master_url,
                                    stack_params, tags, recreate=False,
                                    asynchronous=False,
-                                   protected=False):
+                                   protected=False, stack_details=None):
         """Actually perform the stack create/update.
 
         For parameter info, see :meth:`_create_or_update_stack`.
         """
         cf = CloudFormation(cf_client)
-        stack_exists, stack_details = cf.stack_exists(stack_name)
+        if stack_details is None:
+            stack_exists, stack_details = cf.stack_exists(stack_name)
+        else:
+            stack_exists = bool(stack_details)
 
+        # Whatever happens below, the outputs we have cached for this stack
+        # are about to become stale.
+        self._invalidate_stack_outputs(cf_client.meta.region_name, stack_name)
         # TODO(larsbutler): Show stack status after an operation has completed.
         try:
             if not stack_exists:
@@ -747,8 +1203,10 @@ class YoloClient(object):
                         protected=is_protected,
                     )
             elif stack_exists and not recreate:
+                [the_stack] = stack_details['Stacks']
                 cf.update_stack(
                     stack_name, master_url, stack_params,
+                    tags=self._get_update_tags(the_stack, tags),
                     asynchronous=asynchronous, protected=protected,
                 )
         except botocore.exceptions.ClientError as err:
@@ -771,23 +1229,21 @@ class YoloClient(object):
                 raise YoloError(err)
             else:
                 raise YoloError(err)
-        except yolo.exceptions.CloudFormationError:
-            possible_cause = 'unknown'
-            stack_events = cf_client.describe_stack_events(
-                StackName=stack_name
-            ).get('StackEvents', [])
-            for stack_event in stack_events:
-                if 'ResourceStatusReason' in stack_event:
-                    # Find the first error and report it.
-                    possible_cause = stack_event['ResourceStatusReason']
-                    # It may not be the root cause.
-                    break
-
+        except yolo.exceptions.CloudFormationError as err:
+            # The waiter keeps track of the first resource which failed; it
+            # may not be the root cause.
+            possible_cause = err.possible_cause or 'unknown'
             raise YoloError(
                 'Infrastructure template failed to deploy. '
                 'Possible cause: "{}"\nCheck the CloudFormation dashboard '
                 'for more details.'.format(possible_cause)
             )
+        finally:
+            # Anything read while the operation was running might be stale
+            # as well.
+            self._invalidate_stack_outputs(
+                cf_client.meta.region_name, stack_name
+            )
 
     def show_config(self):
         # NOTE(larsbutler): Generally we access the `rax_username` using the
@@ -848,7 +1304,8 @@ class YoloClient(object):
         print(tabulate.tabulate(table, headers='firstrow'))
 
     def deploy_infra(self, stage=None, account=None, dry_run=False,
-                     asynchronous=False, recreate=False):
+                     asynchronous=False, recreate=False, plan=False,
+                     apply=False):
         """Deploy infrastructure for an account or stage.
 
         :param str stage:
@@ -875,7 +1332,15 @@ class YoloClient(object):
 
             If ``true``, tear down and re-create the stack from scratch.
             Otherwise, just try to update the existing stack.
+        :param bool plan:
+            Set to ``true`` to show the proposed changes like ``dry_run``,
+            but keep the change set (see :meth:`_plan_stack_update`), so that
+            it can be applied later with ``apply``.
+        :param bool apply:
+            Set to ``true`` to apply the changes planned before with ``plan``
+            (see :meth:`_apply_stack_plan`).
         """
+        _check_deploy_mode(dry_run, plan, apply, recreate)
         with_stage = stage is not None
         with_account = account is not None
 
@@ -903,16 +1368,349 @@ class YoloClient(object):
                 dry_run=dry_run,
                 asynchronous=asynchronous,
                 recreate=recreate,
+                plan=plan,
+                apply=apply,
             )
         else:
             # Deploy account-level templates:
             self._deploy_account_stack(
                 dry_run=dry_run,
                 asynchronous=asynchronous,
+                plan=plan,
+                apply=apply,
+            )
+
+    def deploy_infra_many(self, stages=(), accounts=(), all_stacks=False,
+                          dry_run=False, asynchronous=False, recreate=False,
+                          plan=False, apply=False):
+        """Deploy infrastructure for several accounts and/or stages.
+
+        Account-level stacks are deployed before the stage-level stacks in
+        the same account (since stage templates can use account stack
+        outputs). Everything else is deployed concurrently. Output is shown
+        per stack, followed by a summary.
+
+        :param stages:
+            Names of the stages for which to create/update infrastructure.
+        :param accounts:
+            Names or numbers of the accounts for which to create/update
+            infrastructure.
+        :param bool all_stacks:
+            Deploy infrastructure for all accounts (if account templates are
+            defined) and all stages defined in the yolo file (except for the
+            "default" stage).
+
+        For the other parameters, see :meth:`deploy_infra`.
+
+        :raises:
+            :class:`yolo.exceptions.YoloError` if any of the deployments
+            failed.
+        """
+        _check_deploy_mode(dry_run, plan, apply, recreate)
+        jobs = self._get_deploy_plan(stages, accounts, all_stacks)
+        if not jobs:
+            raise YoloError('Nothing to deploy.')
+        if recreate and any(job['account'] is not None for job in jobs):
+            raise YoloError(
+                'Recreating account-level stacks is not allowed (for '
+                'safety purposes). You will need to tear down the stack '
+                'manually.'
+            )
+
+        print('Deploying {} stack(s):'.format(len(jobs)))
+        for job in jobs:
+            print('  {}'.format(job['stack_name']))
+
+        # Get credentials (and prompt for them, if needed) before starting.
+        self._prefetch_sessions(job['account_number'] for job in jobs)
+        # Describe the stacks of each account/region at once, when there are
+        # enough of them.
+        stack_names = {}
+        for job in jobs:
+            stack_names.setdefault(
+                (job['account_number'], job['region']), []
+            ).append(job['stack_name'])
+        for (account_number, region), names in stack_names.items():
+            self.get_stack_snapshot(account_number, region).prefetch(names)
+
+        stdout = sys.stdout
+        router = utils.ThreadOutputRouter(stdout)
+        print_lock = threading.Lock()
+        results = {}
+
+        def deploy(job, depends_on=None):
+            result = dict(
+                stack_name=job['stack_name'], result='SKIPPED', duration=0,
+                error=None,
+            )
+            results[job['stack_name']] = result
+            if depends_on is not None and depends_on.result() != 'OK':
+                result['error'] = 'account-level stack was not deployed'
+                return result['result']
+
+            with print_lock:
+                stdout.write('==> {}: started\n'.format(job['stack_name']))
+                stdout.flush()
+            start = time.time()
+            with router.capture() as output:
+                try:
+                    self._get_worker_client().deploy_infra(
+                        stage=job['stage'], account=job['account'],
+                        dry_run=dry_run, asynchronous=asynchronous,
+                        recreate=recreate, plan=plan, apply=apply,
+                    )
+                    result['result'] = 'OK'
+                except Exception as exc:
+                    # Report the error with the others, at the end.
+                    result['result'] = 'FAILED'
+                    result['error'] = str(exc)
+            result['duration'] = time.time() - start
+
+            with print_lock:
+                stdout.write('==> {}: {} ({:.0f}s)\n'.format(
+                    job['stack_name'], result['result'], result['duration']
+                ))
+                for line in ''.join(output).splitlines():
+                    stdout.write('    {}\n'.format(line))
+                if result['error']:
+                    stdout.write('    {}\n'.format(result['error']))
+                stdout.flush()
+            return result['result']
+
+        sys.stdout = router
+        try:
+            with futures.ThreadPoolExecutor(
+                max_workers=min(len(jobs), const.MAX_WORKERS)
+            ) as executor:
+                # Account-level jobs come first in the plan, so they are
+                # always started before the stage-level jobs waiting on them.
+                account_futures = {}
+                for job in jobs:
+                    if job['account'] is not None:
+                        account_futures[job['account_number']] = (
+                            executor.submit(deploy, job)
+                        )
+                    else:
+                        executor.submit(
+                            deploy, job,
+                            depends_on=account_futures.get(
+                                job['account_number']
+                            ),
+                        )
+        finally:
+            sys.stdout = stdout
+
+        headers = ['StackName', 'Result', 'Duration']
+        table = [headers]
+        for job in jobs:
+            result = results[job['stack_name']]
+            table.append([
+                result['stack_name'],
+                result['result'],
+                '{:.0f}s'.format(result['duration']),
+            ])
+        print(tabulate.tabulate(table, headers='firstrow'))
+
+        failed = [
+            job['stack_name'] for job in jobs
+            if results[job['stack_name']]['result'] != 'OK'
+        ]
+        if failed:
+            raise YoloError(
+                'Failed to deploy {} stack(s): {}'.format(
+                    len(failed), ', '.join(failed)
+                )
+            )
+
+    def _get_deploy_plan(self, stages=(), accounts=(), all_stacks=False):
+        """Work out which stacks :meth:`deploy_infra_many` should deploy.
+
+        :returns:
+            `list` of `dict`s with the keys ``stack_name``,
+            ``account_number``, ``region``, and either ``account`` or
+            ``stage`` (the other one is ``None``). Account-level stacks come
+            first.
+        """
+        has_account_templates = 'account' in self.yolo_file.templates
+        if accounts and not has_account_templates:
+            raise YoloError('No "account" templates are defined.')
+
+        stages = list(stages)
+        accounts = list(accounts)
+        if all_stacks:
+            stages.extend(sorted(
+                name for name in self.yolo_file.stages
+                if name != YoloFile.DEFAULT_STAGE
+            ))
+            if has_account_templates:
+                accounts.extend(
+                    acct['name'] for acct in self.yolo_file.accounts
+                )
+
+        plan = []
+        seen = set()
+        for account in accounts:
+            account_cfg = self.yolo_file.normalize_account(account)
+            stack_name = self.get_account_stack_name(
+                account_cfg.account_number
+            )
+            if stack_name not in seen:
+                seen.add(stack_name)
+                plan.append(dict(
+                    stack_name=stack_name,
+                    account_number=account_cfg.account_number,
+                    region=account_cfg.default_region,
+                    account=account_cfg.account_number,
+                    stage=None,
+                ))
+        for stage in stages:
+            stage_cfg = self.yolo_file.get_stage(stage)
+            account_cfg = stage_cfg.account
+            stack_name = self.get_stage_stack_name(
+                account_cfg.account_number, stage
+            )
+            if stack_name not in seen:
+                seen.add(stack_name)
+                plan.append(dict(
+                    stack_name=stack_name,
+                    account_number=account_cfg.account_number,
+                    region=stage_cfg.region,
+                    account=None,
+                    stage=stage,
+                ))
+        return plan
+
+    def wait_for_stacks(self, stages=(), accounts=(), all_stacks=False,
+                        timeout=None):
+        """Wait for stack operations (e.g., asynchronous deployments).
+
+        The stacks are described on each poll (see
+        :class:`yolo.cloudformation.StackSnapshot`), and the
+        accounts/regions are checked concurrently.
+
+        :param stages:
+            Names of the stages whose stacks to wait for.
+        :param accounts:
+            Names or numbers of the accounts whose account-level stacks to
+            wait for.
+        :param bool all_stacks:
+            Wait for the stacks of all accounts and stages defined in the
+            yolo file.
+        :param int timeout:
+            Give up after this many seconds. Defaults to
+            :attr:`yolo.waiter.VerboseCloudFormationWaiter.MAX_WAIT_TIME`.
+
+        :raises:
+            :class:`yolo.exceptions.YoloError` if any of the stacks didn't
+            end up in a successful state (or didn't finish in time).
+        """
+        jobs = self._get_deploy_plan(stages, accounts, all_stacks)
+        if not jobs:
+            raise YoloError('Nothing to wait for.')
+        if timeout is None:
+            timeout = VerboseCloudFormationWaiter.MAX_WAIT_TIME
+
+        pending = {}
+        for job in jobs:
+            pending.setdefault(
+                (job['account_number'], job['region']), set()
+            ).add(job['stack_name'])
+        self._prefetch_sessions(
+            account_number for account_number, _ in pending
+        )
+
+        print('Waiting for {} stack(s)...'.format(len(jobs)))
+        finished = {}
+        started_at = time.time()
+        interval = VerboseCloudFormationWaiter.MIN_POLL_INTERVAL
+        while True:
+            with futures.ThreadPoolExecutor(
+                max_workers=min(len(pending), const.MAX_WORKERS)
+            ) as executor:
+                # A new snapshot each time; we want to see the changes.
+                snapshots = {
+                    key: executor.submit(
+                        lambda key: cloudformation.StackSnapshot(
+                            self.faws_client.aws_client(
+                                key[0], 'cloudformation', key[1]
+                            )
+                        ).get_stacks(pending[key]),
+                        key,
+                    )
+                    for key in pending
+                }
+
+            progress = False
+            for key, stacks in snapshots.items():
+                stacks = stacks.result()
+                for stack_name in sorted(pending[key]):
+                    stack = stacks[stack_name]
+                    if stack is None:
+                        stack = dict(
+                            StackName=stack_name,
+                            StackStatus='DOES_NOT_EXIST',
+                        )
+                    elif stack['StackStatus'].endswith('_IN_PROGRESS'):
+                        continue
+                    finished[stack_name] = stack
+                    pending[key].discard(stack_name)
+                    progress = True
+                    print('{}: {}'.format(stack_name, stack['StackStatus']))
+                if not pending[key]:
+                    del pending[key]
+
+            if not pending:
+                break
+            if time.time() - started_at > timeout:
+                break
+            if progress:
+                interval = VerboseCloudFormationWaiter.MIN_POLL_INTERVAL
+            else:
+                interval = min(
+                    interval * VerboseCloudFormationWaiter.POLL_BACKOFF,
+                    VerboseCloudFormationWaiter.MAX_POLL_INTERVAL,
+                )
+            time.sleep(interval)
+
+        headers = ['StackName', 'StackStatus', 'Reason']
+        table = [headers]
+        failed = []
+        for job in jobs:
+            stack = finished.get(job['stack_name'])
+            if stack is None:
+                status, reason = 'TIMED_OUT', 'still in progress'
+            else:
+                status = stack['StackStatus']
+                reason = stack.get('StackStatusReason', '')
+            table.append([job['stack_name'], status, reason])
+            if status not in const.STACK_STATUSES_SUCCESSFUL:
+                failed.append(job['stack_name'])
+        print(tabulate.tabulate(table, headers='firstrow'))
+
+        if failed:
+            raise YoloError(
+                '{} stack(s) did not complete successfully: {}'.format(
+                    len(failed), ', '.join(failed)
+                )
             )
 
+    def _get_worker_client(self):
+        """Get a new client for running a command in another thread.
+
+        It shares the (thread-safe) FAWS client, the loaded yolo file and the
+        stack snapshots with this client, but has its own context.
+        """
+        worker = YoloClient(
+            yolo_file=self._yolo_file_path, use_cache=self.use_cache
+        )
+        worker._yolo_file = self.yolo_file
+        worker._faws_client = self.faws_client
+        worker._stack_snapshots = self._stack_snapshots
+        worker._stack_snapshots_lock = self._stack_snapshots_lock
+        return worker
+
     def _deploy_stage_stack(self, dry_run=False, asynchronous=False,
-                            recreate=False):
+                            recreate=False, plan=False, apply=False):
         """Deploy stage-level infrastructure for the current context.
 
         :param bool dry_run:
@@ -930,11 +1728,18 @@ class YoloClient(object):
 
             If ``true``, tear down and re-create the stack from scratch.
             Otherwise, just try to update the existing stack.
+        :param bool plan:
+            Set to ``true`` to show the proposed changes like ``dry_run``,
+            but keep the change set (see :meth:`_plan_stack_update`), so that
+            it can be applied later with ``apply``.
+        :param bool apply:
+            Set to ``true`` to apply the changes planned before with ``plan``
+            (see :meth:`_apply_stack_plan`).
         """
         region = self.context.stage.region
         bucket_folder_prefix = (
             const.BUCKET_FOLDER_PREFIXES['stage-templates'].format(
-                stage=self.context.stage.name, timestamp=self.now_timestamp
+                stage=self.context.stage.name
             )
         )
         templates_cfg = self.yolo_file.templates['stage']
@@ -944,13 +1749,7 @@ class YoloClient(object):
             self.context.stage.name,
         )
 
-        # TODO(larsbutler): Add `protected` attribute to the
-        # ``self.context.stage`` so that we don't have to fetch stage
-        # config to get it.
-        protected = False
-        stage_cfg = self.yolo_file.get_stage_config(self.context.stage.name)
-        if stage_cfg.get('protected', False):
-            protected = True
+        protected = self.yolo_file.get_stage(self.context.stage.name).protected
 
         self._deploy_stack(
             stack_name,
@@ -962,10 +1761,12 @@ class YoloClient(object):
             asynchronous=asynchronous,
             recreate=recreate,
             protected=protected,
+            plan=plan,
+            apply=apply,
         )
 
     def _deploy_account_stack(self, dry_run=False,
-                              asynchronous=False):
+                              asynchronous=False, plan=False, apply=False):
         """Deploy account-level infrastructure for the current context.
 
         :param bool dry_run:
@@ -978,13 +1779,16 @@ class YoloClient(object):
             change. By default ``asynchronous`` is set to ``false``, which
             means that we block and wait for the stack create/update to finish
             before returning.
+        :param bool plan:
+            Set to ``true`` to show the proposed changes like ``dry_run``,
+            but keep the change set (see :meth:`_plan_stack_update`), so that
+            it can be applied later with ``apply``.
+        :param bool apply:
+            Set to ``true`` to apply the changes planned before with ``plan``
+            (see :meth:`_apply_stack_plan`).
         """
         region = self.context.account.default_region
-        bucket_folder_prefix = (
-            const.BUCKET_FOLDER_PREFIXES['account-templates'].format(
-                timestamp=self.now_timestamp
-            )
-        )
+        bucket_folder_prefix = const.BUCKET_FOLDER_PREFIXES['account-templates']
         templates_cfg = self.yolo_file.templates['account']
         stack_name = self.account_stack_name
 
@@ -998,11 +1802,14 @@ class YoloClient(object):
             asynchronous=asynchronous,
             # Always protect account-level infra stacks:
             protected=True,
+            plan=plan,
+            apply=apply,
         )
 
     def _deploy_stack(self, stack_name, templates_path, templates_params,
                       bucket_folder_prefix, region, asynchronous=False,
-                      dry_run=False, protected=False, recreate=False):
+                      dry_run=False, protected=False, recreate=False,
+                      plan=False, apply=False):
         """Deploy the specified template to a new or existing stack.
 
         :param str stack_name:
@@ -1016,7 +1823,8 @@ class YoloClient(object):
         :param str bucket_folder_prefix:
             Location in the yolo S3 bucket to store CloudFormation templates.
             Template files will be copied from the local file system to this
-            location.
+            location, each under a hash of its contents (e.g.,
+            ``<prefix>/<sha256>/master.yaml``).
         :param str region:
             AWS region in which to create the bucket (e.g., us-east-1,
             eu-west-1, etc.).
@@ -1039,17 +1847,18 @@ class YoloClient(object):
 
             If ``true``, tear down and re-create the stack from scratch.
             Otherwise, just try to update the existing stack.
+        :param bool plan:
+            Set to ``true`` to show the proposed changes like ``dry_run``,
+            but keep the change set (see :meth:`_plan_stack_update`), so that
+            it can be applied later with ``apply``.
+        :param bool apply:
+            Set to ``true`` to apply the changes planned before with ``plan``
+            (see :meth:`_apply_stack_plan`).
         """
         tags = [const.YOLO_STACK_TAGS['created-with-yolo-version']]
         if protected:
             tags.append(const.YOLO_STACK_TAGS['protected'])
 
-        bucket = self._ensure_bucket(
-            self.context.account.account_number,
-            region,
-            self.app_bucket_name,
-        )
-
         if os.path.isabs(templates_path):
             full_templates_dir = templates_path
         else:
@@ -1059,63 +1868,173 @@ class YoloClient(object):
                 working_dir, templates_path
             )
 
-        files = os.listdir(full_templates_dir)
-        # filter out yaml/json files
-        cf_files = [
-            f for f in files
-            if (f.endswith('yaml') or
-                f.endswith('yml') or
-                f.endswith('json'))
-        ]
-        [master_template_file] = [
-            f for f in cf_files
-            if f.startswith('master.')
-        ]
+        templates = cloudformation.get_template_files(full_templates_dir)
         # If there were no template files found, let's stop here with a friendly
         # error message.
-        if len(cf_files) == 0:
+        if len(templates) == 0:
             print('No CloudFormation template files found.')
             return
+        master_template_files = [
+            f for f in templates if f.startswith('master.')
+        ]
+        if len(master_template_files) != 1:
+            raise YoloError(
+                'Expected exactly one master.* template in "{}", found '
+                '{}.'.format(full_templates_dir, len(master_template_files))
+            )
+        [master_template_file] = master_template_files
 
-        for cf_file in cf_files:
-            cf_file_full_path = os.path.join(full_templates_dir, cf_file)
-            bucket_key = '{}/{}'.format(bucket_folder_prefix, cf_file)
-            print('uploading s3://{}/{}...'.format(bucket.name, bucket_key))
-            bucket.upload_file(
-                Filename=cf_file_full_path,
-                Key=bucket_key,
-                ExtraArgs=const.S3_UPLOAD_EXTRA_ARGS,
+        # Templates are stored under a hash of their contents, so unchanged
+        # templates don't need to be uploaded again.
+        bucket_name = self.app_bucket_name
+        try:
+            addressed_templates = cloudformation.address_templates_by_content(
+                templates, bucket_name, bucket_folder_prefix
             )
+        except ValueError as err:
+            raise YoloError(str(err))
+        stack_params = [
+            dict(ParameterKey=k, ParameterValue=v)
+            for k, v in templates_params.items()
+        ]
+
+        # The version tag is kept as it is on updates, so it doesn't count.
+        managed_tags = [
+            tag for tag in tags
+            if tag != const.YOLO_STACK_TAGS['created-with-yolo-version']
+        ]
+        # Identifies the configuration a plan was made for.
+        fingerprint = cloudformation.get_fingerprint(
+            addressed_templates, stack_params, managed_tags
+        )
+        _, master_body = addressed_templates[master_template_file]
 
         cf_client = self.faws_client.aws_client(
             self.context.account.account_number,
             'cloudformation',
             region_name=region,
         )
-        # TODO(larsbutler): detect json, yaml, or yml for the master.* file.
-        # Defaults to master.yaml for now.
-        # TODO(larsbutler): Check for master.* template file and show a nice
-        # error message if it is not present.
-        master = '{}/{}'.format(bucket_folder_prefix, master_template_file)
-        # This is the URL to the bucket.
-        master_url = 'https://s3.amazonaws.com/{}/{}'.format(
-            bucket.name, master
+        stack_details = self.get_stack_snapshot(
+            self.context.account.account_number, region
+        ).describe(stack_name)
+        up_to_date = (
+            not recreate and
+            self._is_stack_up_to_date(
+                cf_client, stack_details, master_body.decode('utf-8'),
+                stack_params, managed_tags, protected,
+            )
         )
-        stack_params = [
-            dict(ParameterKey=k, ParameterValue=v)
-            for k, v in templates_params.items()
-        ]
+        if up_to_date:
+            print('stack "{}" is up to date, nothing to deploy.'.format(
+                stack_name
+            ))
+            if apply:
+                # Nothing left to apply; don't leave the plan lying around.
+                self._discard_stack_plan(cf_client, stack_name)
+            return
+        if apply:
+            # The templates were uploaded when the plan was made.
+            try:
+                self._apply_stack_plan(
+                    cf_client, stack_name, fingerprint,
+                    asynchronous=asynchronous, protected=protected,
+                )
+            except yolo.exceptions.CloudFormationError as err:
+                raise YoloError(str(err))
+            return
+
+        bucket = self._ensure_bucket(
+            self.context.account.account_number,
+            region,
+            bucket_name,
+        )
+        self._upload_templates(bucket, addressed_templates)
+
+        master, _ = addressed_templates[master_template_file]
+        # This is the URL to the bucket.
+        master_url = cloudformation.get_s3_url(bucket.name, master)
+
+        if plan:
+            try:
+                self._plan_stack_update(
+                    cf_client, stack_name, master_url, stack_params, tags,
+                    fingerprint, stack_details,
+                )
+            except yolo.exceptions.CloudFormationError as err:
+                raise YoloError(str(err))
+            return
 
         try:
             self._create_or_update_stack(
                 cf_client, stack_name, master_url, stack_params, tags,
                 dry_run=dry_run, recreate=recreate, asynchronous=asynchronous,
-                protected=protected,
+                protected=protected, stack_details=stack_details,
             )
         except yolo.exceptions.CloudFormationError as err:
             # Re-raise it as a friendly error message:
             raise YoloError(str(err))
 
+    @staticmethod
+    def _is_stack_up_to_date(cf_client, stack_details, template_body,
+                             stack_params, tags, protected):
+        """Check if a stack was last deployed with the same configuration.
+
+        :param dict stack_details:
+            ``describe_stacks`` response for the stack, or an empty `dict` if
+            the stack doesn't exist.
+        :param str template_body:
+            Contents of the master template to deploy.
+        :param list stack_params:
+            Stack parameters to deploy.
+        :param list tags:
+            Tags the stack should have.
+        :param bool protected:
+            Whether or not the stack is supposed to have termination
+            protection.
+        """
+        if not stack_details:
+            return False
+        [the_stack] = stack_details['Stacks']
+        if the_stack['StackStatus'] not in const.STACK_STATUSES_UP_TO_DATE:
+            # Something is in progress or has failed.
+            return False
+        if protected and not the_stack.get('EnableTerminationProtection'):
+            return False
+        stack_tags = {
+            tag['Key']: tag['Value'] for tag in the_stack.get('Tags', [])
+        }
+        if any(stack_tags.get(tag['Key']) != tag['Value'] for tag in tags):
+            return False
+        return CloudFormation(cf_client).is_deployed(
+            the_stack, template_body, stack_params
+        )
+
+    @staticmethod
+    def _get_update_tags(the_stack, tags):
+        """Get the tags to update a stack with.
+
+        Tags added to the stack by other means are kept, and so is the yolo
+        version the stack was created with.
+
+        :param dict the_stack:
+            Stack description (from ``describe_stacks``).
+        :param list tags:
+            Tags to apply to the stack. Each list item is a dict containing
+            the keys ``Key`` and ``Value``.
+        """
+        update_tags = {
+            tag['Key']: tag['Value'] for tag in the_stack.get('Tags', [])
+        }
+        version_key = const.YOLO_STACK_TAGS['created-with-yolo-version']['Key']
+        for tag in tags:
+            if tag['Key'] == version_key and version_key in update_tags:
+                continue
+            update_tags[tag['Key']] = tag['Value']
+        return [
+            dict(Key=key, Value=value)
+            for key, value in sorted(update_tags.items())
+        ]
+
     def status(self, stage=None):
         self.set_up_yolofile_context()
         self._yolo_file = self.yolo_file.render(**self.context)
@@ -1126,51 +2045,47 @@ class YoloClient(object):
 
         # TODO(larsbutler): Validate `stage`
         stgs_accts_regions = self._stages_accounts_regions(self.yolo_file, stage)
-        stack_names = set()
 
+        # Look up the stacks of each account/region only once: either all
+        # stacks of the app (for the "default" stage, which covers ad-hoc
+        # stages), or just those of the stages in that account/region.
+        groups = {}
         for stg_name, account, region in stgs_accts_regions:
-            aws_account = self.yolo_file.normalize_account(account)
-            cf_client = self.faws_client.aws_client(
-                aws_account.account_number, 'cloudformation', region_name=region
+            account_number = (
+                self.yolo_file.normalize_account(account).account_number
             )
+            stack_names = groups.setdefault((account_number, region), set())
             if stg_name == YoloFile.DEFAULT_STAGE:
-                stacks_paginator = cf_client.get_paginator('list_stacks')
-                for page in stacks_paginator.paginate():
-                    for stack in page['StackSummaries']:
-                        if (
-                            stack['StackName'].startswith(self.yolo_file.app_name) and
-                            stack['StackStatus'] != 'DELETE_COMPLETE'
-                        ):
-                            if stack['StackName'] not in stack_names:
-                                table.append([
-                                    stack['StackName'],
-                                    stack.get('TemplateDescription', ''),
-                                    stack['StackStatus'],
-                                ])
-                                stack_names.add(stack['StackName'])
+                stack_names.add(None)
             else:
-                # It's an explicit stage name so we can statically query on the
-                # stack.
-                stack_name = '{}-{}-{}'.format(
-                    self.yolo_file.app_name,
-                    aws_account.account_number,
-                    stg_name,
+                stack_names.add(
+                    self.get_stage_stack_name(account_number, stg_name)
                 )
-                try:
-                    stack_desc = cf_client.describe_stacks(StackName=stack_name)
-                except botocore.exceptions.ClientError as err:
-                    if 'does not exist' in str(err):
-                        # Doesn't exist; nothing to show.
-                        pass
-                else:
-                    stack = stack_desc['Stacks'][0]
-                    if stack['StackName'] not in stack_names:
-                        table.append([
-                            stack['StackName'],
-                            stack.get('Description', ''),
-                            stack['StackStatus'],
-                        ])
-                        stack_names.add(stack['StackName'])
+
+        self._prefetch_sessions(
+            account_number for account_number, _ in groups
+        )
+
+        with futures.ThreadPoolExecutor(
+            max_workers=min(len(groups), const.MAX_WORKERS)
+        ) as executor:
+            group_futures = [
+                executor.submit(
+                    self._list_app_stacks, account_number, region,
+                    stack_names=None if None in stack_names else stack_names,
+                )
+                for (account_number, region), stack_names in groups.items()
+            ]
+        stacks = {}
+        for future in group_futures:
+            for stack in future.result():
+                stacks.setdefault(stack['StackName'], stack)
+        for stack_name in sorted(stacks):
+            table.append([
+                stack_name,
+                stacks[stack_name].get('TemplateDescription', ''),
+                stacks[stack_name]['StackStatus'],
+            ])
 
         # Only print table if we have at least one stack to display.
         if len(table) > 1:
@@ -1196,6 +2111,7 @@ class YoloClient(object):
             self.set_up_yolofile_context(stage=stage)
             self._yolo_file = self.yolo_file.render(**self.context)
 
+            from yolo.services import lambda_service
             lambda_svc = lambda_service.LambdaService(
                 self.yolo_file, self.faws_client, self.context
             )
@@ -1256,6 +2172,7 @@ class YoloClient(object):
             self.app_bucket_name,
         )
 
+        from yolo.services import lambda_service
         if timeout is None:
             timeout = lambda_service.LambdaService.DEFAULT_TIMEOUT
         lambda_svc = lambda_service.LambdaService(
@@ -1277,6 +2194,7 @@ class YoloClient(object):
             self.app_bucket_name,
         )
 
+        from yolo.services import s3_service
         s3_svc = s3_service.S3Service(
             self.yolo_file, self.faws_client, self.context
         )
@@ -1293,9 +2211,18 @@ class YoloClient(object):
         )
 
         # Select Python shell
-        if have_bpython:
+        try:
+            import bpython
+        except ImportError:
+            bpython = None
+        try:
+            from IPython import start_ipython
+        except ImportError:
+            start_ipython = None
+
+        if bpython is not None:
             bpython.embed()
-        elif have_ipython:
+        elif start_ipython is not None:
             start_ipython(argv=[])
         else:
             code.interact()
@@ -1405,23 +2332,8 @@ class YoloClient(object):
         self.set_up_yolofile_context(stage=stage)
         self._yolo_file = self.yolo_file.render(**self.context)
 
-        service_cfg = self._get_service_cfg(service)
-        # Get the default parameters first, if available.
-        parameters = service_cfg['deploy']['parameters']['stages'].get(
-            'default', []
-        )
-        # Convert the list to a dict, so that it can be easily overridden by
-        # stage-specific parameters.
-        parameters_dict = {p['name']: p for p in parameters}
-        # Get the stage-specific parameters.
-        stage_parameters = service_cfg['deploy']['parameters']['stages'].get(
-            stage, []
-        )
-        stage_parameters_dict = {p['name']: p for p in stage_parameters}
-        # Override default parameters with any stage-specific ones.
-        parameters_dict.update(stage_parameters_dict)
-        # Convert back to a list that we'll use going forward.
-        parameters = parameters_dict.values()
+        # Default parameters, overridden by any stage-specific ones:
+        parameters = self.yolo_file.get_service(service).get_parameters(stage)
 
         if len(param) > 0:
             # Only set specific params.
@@ -1545,6 +2457,7 @@ class YoloClient(object):
         self.set_up_yolofile_context(stage=stage)
         self._yolo_file = self.yolo_file.render(**self.context)
 
+        from yolo.services import lambda_service
         lambda_svc = lambda_service.LambdaService(
             self.yolo_file, self.faws_client, self.context
         )
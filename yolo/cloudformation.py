@@ -14,16 +14,146 @@
 
 from __future__ import print_function
 
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+
 import botocore.exceptions
 
+from yolo.exceptions import CloudFormationError
 from yolo.exceptions import StackDoesNotExist
 from yolo import utils
 from yolo.waiter import VerboseCloudFormationWaiter
 
+TEMPLATE_EXTENSIONS = ('yaml', 'yml', 'json')
+# A `TemplateURL` property on a single line, in YAML or JSON, like:
+#   TemplateURL: ./network.yaml
+#   "TemplateURL": "network.json",
+TEMPLATE_URL_RE = re.compile(
+    r'^(?P<prefix>\s*"?TemplateURL"?\s*:\s*)'
+    r'(?P<quote>[\'"]?)(?P<url>[^\s\'"]+)(?P=quote)'
+    r'(?P<suffix>\s*,?\s*)$',
+    re.MULTILINE,
+)
+
+
+def get_template_files(templates_dir):
+    """Read all CloudFormation templates in a directory.
+
+    :returns:
+        `dict` of file name -> file contents (as bytes).
+    """
+    templates = {}
+    for filename in os.listdir(templates_dir):
+        if filename.endswith(TEMPLATE_EXTENSIONS):
+            with open(os.path.join(templates_dir, filename), 'rb') as fp:
+                templates[filename] = fp.read()
+    return templates
+
+
+def address_templates_by_content(templates, bucket_name, prefix):
+    """Give each template an S3 key based on a hash of its contents.
+
+    ``TemplateURL`` properties which refer to another template in the same
+    directory (e.g., ``TemplateURL: ./network.yaml``) are rewritten to the
+    S3 URL of that template. Since those URLs contain a hash of the nested
+    template, a change to a nested template also changes the key of every
+    template which uses it.
+
+    :param dict templates:
+        File name -> file contents, see :func:`get_template_files`.
+    :param str bucket_name:
+        Name of the S3 bucket the templates will be uploaded to.
+    :param str prefix:
+        Location in the bucket to store the templates in.
+    :returns:
+        `dict` of file name -> (S3 key, contents to upload).
+    """
+    addressed = {}
+
+    def address(filename, seen=()):
+        if filename in addressed:
+            return addressed[filename]
+        if filename in seen:
+            raise ValueError(
+                'Templates reference each other in a cycle: {}'.format(
+                    ' -> '.join(seen + (filename,))
+                )
+            )
+
+        def replace_url(match):
+            url = match.group('url')
+            nested = url[2:] if url.startswith('./') else url
+            if nested not in templates:
+                return match.group(0)
+            nested_key, _ = address(nested, seen + (filename,))
+            return '{prefix}{quote}{url}{quote}{suffix}'.format(
+                prefix=match.group('prefix'),
+                quote=match.group('quote'),
+                url=get_s3_url(bucket_name, nested_key),
+                suffix=match.group('suffix'),
+            )
+
+        body = TEMPLATE_URL_RE.sub(
+            replace_url, templates[filename].decode('utf-8')
+        ).encode('utf-8')
+        key = '{}/{}/{}'.format(
+            prefix, hashlib.sha256(body).hexdigest(), filename
+        )
+        addressed[filename] = (key, body)
+        return addressed[filename]
+
+    for filename in templates:
+        address(filename)
+    return addressed
+
+
+def get_fingerprint(templates, stack_params, tags):
+    """Compute a fingerprint of everything that goes into a stack deployment.
+
+    :param dict templates:
+        File name -> (S3 key, contents), see
+        :func:`address_templates_by_content`. The S3 keys already contain a
+        hash of the contents.
+    :param list stack_params:
+        Stack parameters, as passed to the CloudFormation API.
+    :param list tags:
+        Stack tags, as passed to the CloudFormation API.
+    :returns:
+        SHA-256 hex digest.
+    """
+    config = dict(
+        templates=sorted(key for key, _ in templates.values()),
+        parameters=sorted(
+            (param['ParameterKey'], param.get('ParameterValue'))
+            for param in stack_params
+        ),
+        tags=sorted((tag['Key'], tag['Value']) for tag in tags),
+    )
+    return hashlib.sha256(
+        json.dumps(config, sort_keys=True).encode('utf-8')
+    ).hexdigest()
+
+
+def get_s3_url(bucket_name, key):
+    """Get the URL of an S3 object, for use in CloudFormation API calls."""
+    return 'https://s3.amazonaws.com/{}/{}'.format(bucket_name, key)
+
 
 class CloudFormation(object):
     CF_CAPABILITY_IAM = 'CAPABILITY_IAM'
     CF_CAPABILITY_NAMED_IAM = 'CAPABILITY_NAMED_IAM'
+    # Change set poll intervals (in seconds): start with
+    # CHANGE_SET_MIN_POLL_INTERVAL, and multiply by CHANGE_SET_POLL_BACKOFF
+    # (up to CHANGE_SET_MAX_POLL_INTERVAL) after each poll.
+    CHANGE_SET_MIN_POLL_INTERVAL = 1
+    CHANGE_SET_MAX_POLL_INTERVAL = 10
+    CHANGE_SET_POLL_BACKOFF = 1.5
+    # Give up after this many seconds.
+    CHANGE_SET_MAX_WAIT_TIME = 600
 
     def __init__(self, cf_client):
         self._cf = cf_client
@@ -57,11 +187,12 @@ class CloudFormation(object):
         print('creating stack "{}"...'.format(result['StackId']))
         if not asynchronous:
             create_waiter = VerboseCloudFormationWaiter(self._cf, 'stack_create_complete')
-            create_waiter.wait(StackName=stack_name)
+            # All events of the new stack belong to this operation.
+            create_waiter.wait(StackName=result['StackId'])
             print('stack "{}" created.'.format(stack_name))
 
     def update_stack(self, stack_name, master_url, stack_params,
-                     asynchronous=False, protected=False):
+                     tags=None, asynchronous=False, protected=False):
         if protected:
             # Add termination protection before anything:
             self._cf.update_termination_protection(
@@ -70,16 +201,24 @@ class CloudFormation(object):
             )
 
         # Update the stack
-        result = self._cf.update_stack(
+        update_stack_params = dict(
             StackName=stack_name,
             Parameters=stack_params,
             TemplateURL=master_url,
             Capabilities=[self.CF_CAPABILITY_IAM, self.CF_CAPABILITY_NAMED_IAM],
         )
-        print('updating stack "{}"...'.format(result['StackId']))
+        if tags is not None:
+            # Otherwise, the existing tags are kept.
+            update_stack_params['Tags'] = tags
         if not asynchronous:
             update_waiter = VerboseCloudFormationWaiter(self._cf, 'stack_update_complete')
-            update_waiter.wait(StackName=stack_name)
+            last_event_id = update_waiter.get_last_event_id(StackName=stack_name)
+        result = self._cf.update_stack(**update_stack_params)
+        print('updating stack "{}"...'.format(result['StackId']))
+        if not asynchronous:
+            update_waiter.wait(
+                StackName=stack_name, after_event_id=last_event_id
+            )
             print('stack "{}" updated.'.format(stack_name))
 
     def recreate_stack(self, stack_name, master_url, stack_params,
@@ -90,9 +229,10 @@ class CloudFormation(object):
         print('deleting stack "{}"... (this may take a while)'.format(
             stack_name
         ))
-        self._cf.delete_stack(StackName=stack_name)
         delete_waiter = VerboseCloudFormationWaiter(self._cf, 'stack_delete_complete')
-        delete_waiter.wait(StackName=stack_name)
+        last_event_id = delete_waiter.get_last_event_id(StackName=stack_name)
+        self._cf.delete_stack(StackName=stack_name)
+        delete_waiter.wait(StackName=stack_name, after_event_id=last_event_id)
         print('stack "{}" has been deleted'.format(stack_name))
         self.create_stack(stack_name, master_url, stack_params,
                           tags, asynchronous=asynchronous, protected=protected)
@@ -114,16 +254,153 @@ class CloudFormation(object):
                 self.CF_CAPABILITY_NAMED_IAM,
             ],
         )
-        waiter = self._cf.get_waiter('change_set_create_complete')
-        waiter.wait(
+        try:
+            self.wait_for_change_set(stack_name, result['Id'])
+        except CloudFormationError:
+            # Don't leave failed change sets lying around.
+            try:
+                self._cf.delete_change_set(
+                    StackName=stack_name, ChangeSetName=result['Id']
+                )
+            except botocore.exceptions.ClientError:
+                # Report the original error instead.
+                pass
+            raise
+        return result
+
+    def wait_for_change_set(self, stack_name, change_set_name):
+        """Wait until CloudFormation has finished creating a change set.
+
+        Polling starts out quick (most change sets are ready within a few
+        seconds) and backs off up to ``CHANGE_SET_MAX_POLL_INTERVAL``.
+
+        :raises:
+            :class:`yolo.exceptions.CloudFormationError` if the change set
+            could not be created.
+        """
+        started_at = time.time()
+        interval = self.CHANGE_SET_MIN_POLL_INTERVAL
+        while True:
+            # Only the status is needed, so don't page through the changes.
+            response = self._cf.describe_change_set(
+                ChangeSetName=change_set_name, StackName=stack_name,
+            )
+            status = response['Status']
+            if status == 'CREATE_COMPLETE':
+                return
+            elif status == 'FAILED':
+                raise CloudFormationError(
+                    'Unable to create change set: {}'.format(
+                        response.get('StatusReason')
+                    )
+                )
+            if time.time() - started_at > self.CHANGE_SET_MAX_WAIT_TIME:
+                raise CloudFormationError(
+                    'The change set took too long to create.'
+                )
+            time.sleep(interval)
+            interval = min(
+                interval * self.CHANGE_SET_POLL_BACKOFF,
+                self.CHANGE_SET_MAX_POLL_INTERVAL,
+            )
+
+    def describe_change_set(self, stack_name, change_set_name):
+        """Describe a change set, with the changes from all pages."""
+        kwargs = dict(ChangeSetName=change_set_name, StackName=stack_name)
+        change_set_desc = self._cf.describe_change_set(**kwargs)
+        next_token = change_set_desc.pop('NextToken', None)
+        while next_token:
+            response = self._cf.describe_change_set(
+                NextToken=next_token, **kwargs
+            )
+            change_set_desc['Changes'].extend(response['Changes'])
+            next_token = response.get('NextToken')
+        return change_set_desc
+
+    def get_template_body(self, stack_name, change_set_name=None):
+        """Get the template of a stack (or of one of its change sets)."""
+        kwargs = dict(StackName=stack_name)
+        if change_set_name is not None:
+            kwargs['ChangeSetName'] = change_set_name
+        return self._cf.get_template(**kwargs)['TemplateBody']
+
+    def execute_change_set(self, stack_name, change_set_name,
+                           asynchronous=False, protected=False):
+        if protected:
+            # Add termination protection before anything:
+            self._cf.update_termination_protection(
+                EnableTerminationProtection=True,
+                StackName=stack_name,
+            )
+
+        if not asynchronous:
+            update_waiter = VerboseCloudFormationWaiter(self._cf, 'stack_update_complete')
+            last_event_id = update_waiter.get_last_event_id(StackName=stack_name)
+        self._cf.execute_change_set(
             ChangeSetName=change_set_name,
             StackName=stack_name,
-            WaiterConfig={
-                'Delay': 5,
-                'MaxAttempts': 120,
-            },
         )
-        return result
+        print('updating stack "{}"...'.format(stack_name))
+        if not asynchronous:
+            update_waiter.wait(
+                StackName=stack_name, after_event_id=last_event_id
+            )
+            print('stack "{}" updated.'.format(stack_name))
+
+    def is_deployed(self, the_stack, template_body, stack_params):
+        """Check if a stack runs the given template and parameters.
+
+        Nested templates are covered by the master template, since their S3
+        URLs contain a hash of their contents (see
+        :func:`address_templates_by_content`).
+
+        :param dict the_stack:
+            Stack description (from ``describe_stacks``).
+        :param str template_body:
+            Contents of the master template.
+        :param list stack_params:
+            Stack parameters, as passed to the CloudFormation API.
+        """
+        stack_id = the_stack['StackId']
+        current_body = self.get_template_body(stack_id)
+        if isinstance(current_body, dict):
+            # botocore decodes JSON templates.
+            try:
+                if current_body != json.loads(template_body):
+                    return False
+            except ValueError:
+                return False
+        elif current_body != template_body:
+            return False
+
+        current_params = {
+            param['ParameterKey']: param.get('ParameterValue')
+            for param in the_stack.get('Parameters', [])
+        }
+        params = {
+            param['ParameterKey']: param.get('ParameterValue')
+            for param in stack_params
+        }
+        if not set(params).issubset(current_params):
+            return False
+        defaults = None
+        for key, value in current_params.items():
+            if key in params:
+                expected = params[key]
+            else:
+                # Parameters which are not passed get their default value.
+                if defaults is None:
+                    summary = self._cf.get_template_summary(StackName=stack_id)
+                    defaults = {
+                        param['ParameterKey']: param.get('DefaultValue')
+                        for param in summary['Parameters']
+                    }
+                expected = defaults.get(key)
+            # Note that values of ``NoEcho`` parameters are masked, so
+            # stacks with those are never considered deployed.
+            if value != expected:
+                return False
+        return True
 
     def get_stack_outputs(self, stack_name):
         try:
@@ -133,12 +410,109 @@ class CloudFormation(object):
                 raise StackDoesNotExist()
             else:
                 raise
-        if 'Outputs' in response['Stacks'][0]:
-            outputs = {
-                output['OutputKey']: output['OutputValue']
-                for output
-                in response['Stacks'][0]['Outputs']
-            }
-        else:
-            outputs = {}
-        return outputs
+        return get_outputs(response['Stacks'][0])
+
+
+class StackSnapshot(object):
+    """Descriptions of the stacks in an account/region, fetched once each.
+
+    Stacks are described by name (one request each) the first time they are
+    looked up. When many stacks are needed at once, :meth:`prefetch`
+    describes them with one paginated sweep over all stacks instead. Call
+    :meth:`forget` to see changes made to a stack since it was described.
+    """
+    # Only sweep over all stacks of an account/region when at least this many
+    # stacks are needed. Sweeps can take many pages in shared accounts (and
+    # need permission to describe all stacks).
+    SWEEP_THRESHOLD = 10
+
+    def __init__(self, cf_client):
+        self._cf = cf_client
+        # Stack name -> stack description (or `None` if it doesn't exist)
+        self._stacks = {}
+        self._lock = threading.Lock()
+
+    def prefetch(self, stack_names):
+        """Describe several stacks at once, if there are enough of them.
+
+        :param stack_names:
+            Iterable of stack names.
+        """
+        with self._lock:
+            missing = set(stack_names) - set(self._stacks)
+        if len(missing) < self.SWEEP_THRESHOLD:
+            # Not worth it; the stacks are described when looked up.
+            return
+        stacks = dict.fromkeys(missing)
+        paginator = self._cf.get_paginator('describe_stacks')
+        for page in paginator.paginate():
+            for stack in page['Stacks']:
+                if stack['StackName'] in missing:
+                    stacks[stack['StackName']] = stack
+        with self._lock:
+            for stack_name, stack in stacks.items():
+                self._stacks.setdefault(stack_name, stack)
+
+    def get_stacks(self, stack_names):
+        """Describe several stacks.
+
+        :returns:
+            `dict` of stack name -> stack description (or `None` if the stack
+            doesn't exist).
+        """
+        stack_names = list(stack_names)
+        self.prefetch(stack_names)
+        return {
+            stack_name: self._get_stack(stack_name)
+            for stack_name in stack_names
+        }
+
+    def forget(self, stack_name):
+        """Drop the description of a stack (e.g., because it changed)."""
+        with self._lock:
+            self._stacks.pop(stack_name, None)
+
+    def _get_stack(self, stack_name):
+        with self._lock:
+            if stack_name in self._stacks:
+                return self._stacks[stack_name]
+        try:
+            [stack] = self._cf.describe_stacks(StackName=stack_name)['Stacks']
+        except botocore.exceptions.ClientError as err:
+            if 'does not exist' not in str(err):
+                raise
+            stack = None
+        with self._lock:
+            return self._stacks.setdefault(stack_name, stack)
+
+    def describe(self, stack_name):
+        """Describe a stack, like :meth:`CloudFormation.stack_exists`.
+
+        :returns:
+            ``describe_stacks``-like response for the stack, or an empty
+            `dict` if the stack doesn't exist.
+        """
+        stack = self._get_stack(stack_name)
+        if stack is None:
+            return {}
+        return dict(Stacks=[stack])
+
+    def get_stack_outputs(self, stack_name):
+        """Get the outputs of a stack.
+
+        :raises:
+            :class:`yolo.exceptions.StackDoesNotExist` if the stack doesn't
+            exist.
+        """
+        stack = self._get_stack(stack_name)
+        if stack is None:
+            raise StackDoesNotExist()
+        return get_outputs(stack)
+
+
+def get_outputs(stack):
+    """Get the outputs of a stack description as a `dict`."""
+    return {
+        output['OutputKey']: output['OutputValue']
+        for output in stack.get('Outputs', [])
+    }
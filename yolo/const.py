@@ -19,6 +19,12 @@ DEFAULT_FILENAMES = [YOLO_YAML, 'yolo.yml']
 RACKSPACE_USERNAME = 'RACKSPACE_USERNAME'
 RACKSPACE_API_KEY = 'RACKSPACE_API_KEY'
 AWS_PROFILE_NAME = 'AWS_PROFILE_NAME'
+# Environment variable for overriding how long (in seconds) stack outputs are
+# cached locally.
+OUTPUTS_CACHE_TTL = 'YOLO_OUTPUTS_CACHE_TTL'
+DEFAULT_OUTPUTS_CACHE_TTL = 600
+# Directory (next to the yolo.yaml file) for yolo's local state and caches
+YOLO_DIR = '.yolo'
 NAMESPACE = 'yolo'
 SWAGGER_YAML = 'swagger.yaml'
 # FAWS account service level IDs and their respective human-readable labels.
@@ -36,9 +42,52 @@ YOLO_STACK_TAGS = {
     ),
     'protected': dict(Key='yolo:Protected', Value='true'),
 }
+# Stack statuses which mean that the stack matches the configuration it was
+# last (successfully) deployed with. Note that a failed update also rolls back
+# the template, parameters and tags.
+STACK_STATUSES_UP_TO_DATE = (
+    'CREATE_COMPLETE',
+    'UPDATE_COMPLETE',
+    'UPDATE_ROLLBACK_COMPLETE',
+    'IMPORT_COMPLETE',
+)
+# Stack statuses which mean that the last create/update succeeded.
+STACK_STATUSES_SUCCESSFUL = (
+    'CREATE_COMPLETE',
+    'UPDATE_COMPLETE',
+    'IMPORT_COMPLETE',
+)
+# All stack statuses except for DELETE_COMPLETE (deleted stacks are still
+# listed for a while).
+ACTIVE_STACK_STATUSES = [
+    'CREATE_IN_PROGRESS',
+    'CREATE_FAILED',
+    'CREATE_COMPLETE',
+    'ROLLBACK_IN_PROGRESS',
+    'ROLLBACK_FAILED',
+    'ROLLBACK_COMPLETE',
+    'DELETE_IN_PROGRESS',
+    'DELETE_FAILED',
+    'UPDATE_IN_PROGRESS',
+    'UPDATE_COMPLETE_CLEANUP_IN_PROGRESS',
+    'UPDATE_COMPLETE',
+    'UPDATE_FAILED',
+    'UPDATE_ROLLBACK_IN_PROGRESS',
+    'UPDATE_ROLLBACK_FAILED',
+    'UPDATE_ROLLBACK_COMPLETE_CLEANUP_IN_PROGRESS',
+    'UPDATE_ROLLBACK_COMPLETE',
+    'REVIEW_IN_PROGRESS',
+    'IMPORT_IN_PROGRESS',
+    'IMPORT_COMPLETE',
+    'IMPORT_ROLLBACK_IN_PROGRESS',
+    'IMPORT_ROLLBACK_FAILED',
+    'IMPORT_ROLLBACK_COMPLETE',
+]
 BUCKET_FOLDER_PREFIXES = {
-    'account-templates': 'templates/account/{timestamp}',
-    'stage-templates': 'templates/stages/{stage}/{timestamp}',
+    # Templates are stored in a sub-folder named after a hash of their
+    # contents.
+    'account-templates': 'templates/account',
+    'stage-templates': 'templates/stages/{stage}',
     'stage-builds': 'builds/stages/{stage}/services/{service}',
     'stage-build': (
         'builds/stages/{stage}/services/{service}/{sha1}/{timestamp}'
@@ -51,5 +100,7 @@ BUCKET_FOLDER_PREFIXES = {
 # This tells deployed applications where to find config/secrets in SSM.
 SSM_CONFIG_VERSION = 'SSM_CONFIG_VERSION'
 S3_UPLOAD_EXTRA_ARGS = dict(ACL='private', ServerSideEncryption='AES256')
+# Maximum number of threads to use for concurrent API calls.
+MAX_WORKERS = 10
 
 API_GATEWAY_INTEGRATION_AWS = 'AWS'
@@ -1,16 +1,22 @@
 import boto3
 
+from yolo.aws_clients import ClientRegistry
+
 
 class AWSCLICredentials(object):
 
     def __init__(self, profile_name):
         self.profile_name = profile_name
         self.session = boto3.session.Session(profile_name=profile_name)
+        self.client_registry = ClientRegistry()
 
     def get_aws_account_credentials(self, aws_account_number, duration=3600):
         # We'll just ignore all arguments, because credentials are already
         # available, we just need to get them from the session.
-        creds = self.session.get_credentials()
+        # NOTE: For profiles which assume a role, botocore refreshes the
+        # credentials before they expire. Freezing them makes sure we get a
+        # fresh and consistent set (key, secret, token) in that case.
+        creds = self.session.get_credentials().get_frozen_credentials()
         janus_style_creds = {
             'accessKeyId': creds.access_key,
             'secretAccessKey': creds.secret_key,
@@ -24,4 +30,7 @@ class AWSCLICredentials(object):
         return self.session
 
     def aws_client(self, acct_num, aws_service, region_name=None, **kwargs):
-        return self.session.client(aws_service, region_name=region_name, **kwargs)
+        return self.client_registry.get_client(
+            self.session, acct_num, aws_service, region_name=region_name,
+            **kwargs
+        )
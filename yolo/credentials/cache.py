@@ -0,0 +1,143 @@
+# Copyright 2017 Rackspace US, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import calendar
+import datetime
+import json
+import logging
+import threading
+import time
+
+from botocore.utils import parse_timestamp
+import keyring
+
+from yolo import const
+
+LOG = logging.getLogger(__name__)
+
+# Stop handing out cached credentials this many seconds before they actually
+# expire. botocore starts refreshing credentials 15 minutes before expiry, so
+# anything shorter than that would just cause a refresh on every API call.
+EXPIRY_MARGIN = 15 * 60
+
+
+def to_epoch(timestamp):
+    """Convert an ISO 8601 timestamp string to seconds since the epoch.
+
+    Example: '2017-10-03T20:38:03.432Z' -> 1507063083
+    """
+    return calendar.timegm(parse_timestamp(timestamp).utctimetuple())
+
+
+def to_timestamp(epoch):
+    """Convert seconds since the epoch to an ISO 8601 UTC timestamp string.
+
+    Example: 1507063083 -> '2017-10-03T20:38:03Z'
+    """
+    return datetime.datetime.utcfromtimestamp(epoch).strftime(
+        '%Y-%m-%dT%H:%M:%SZ'
+    )
+
+
+class KeyringCache(object):
+    """Cache short-lived secrets (temporary credentials, tokens) in keyring.
+
+    Entries are stored as JSON, together with the time they expire, and are
+    only handed back while they are still valid for at least
+    ``expiry_margin`` seconds. Entries are also kept in memory, so repeated
+    lookups in the same process don't have to go back to the keyring.
+
+    The ``hits`` and ``misses`` counters can be used to see how effective
+    the cache is.
+    """
+
+    def __init__(self, namespace=const.NAMESPACE, expiry_margin=EXPIRY_MARGIN):
+        self.namespace = namespace
+        self.expiry_margin = expiry_margin
+        self.hits = 0
+        self.misses = 0
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    @property
+    def stats(self):
+        return dict(hits=self.hits, misses=self.misses)
+
+    def get(self, key):
+        """Get a cached value, or ``None`` if it is missing or expired."""
+        with self._lock:
+            return self._get(key)
+
+    def _get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = self._load(key)
+        if entry is None or self._is_expired(entry):
+            self.misses += 1
+            LOG.info('Cache miss for "%s"', key)
+            return None
+
+        self._entries[key] = entry
+        self.hits += 1
+        LOG.info('Cache hit for "%s"', key)
+        return entry['value']
+
+    def set(self, key, value, expires_at):
+        """Cache a JSON-serializable ``value`` until ``expires_at``.
+
+        :param str key:
+            Unique name of the cache entry.
+        :param value:
+            Any JSON-serializable object.
+        :param float expires_at:
+            Expiration time of the ``value``, in seconds since the epoch.
+        """
+        entry = dict(value=value, expires_at=expires_at)
+        with self._lock:
+            self._entries[key] = entry
+            try:
+                keyring.set_password(self.namespace, key, json.dumps(entry))
+            except Exception as exc:
+                # Caching is only an optimization; don't fail the command.
+                LOG.warning('Unable to cache "%s" in keyring: %s', key, exc)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+            try:
+                keyring.delete_password(self.namespace, key)
+            except Exception:
+                # Nothing was cached, or the keyring backend is not available.
+                pass
+
+    def _load(self, key):
+        try:
+            raw_entry = keyring.get_password(self.namespace, key)
+        except Exception as exc:
+            LOG.warning('Unable to read "%s" from keyring: %s', key, exc)
+            return None
+        if raw_entry is None:
+            return None
+        try:
+            return json.loads(raw_entry)
+        except ValueError:
+            # Corrupt entry; ignore it and let it be overwritten.
+            return None
+
+    def _is_expired(self, entry):
+        expires_at = entry.get('expires_at')
+        if expires_at is None:
+            # Entries without an expiry can't be trusted.
+            return True
+        return expires_at - self.expiry_margin <= time.time()
@@ -31,3 +31,13 @@ class ResourceNotFound(Exception):
 
 class CloudFormationError(Exception):
     """Errors related to CloudFormation resource management."""
+
+    def __init__(self, message, possible_cause=None):
+        """
+        :param str message:
+            Description of the error.
+        :param str possible_cause:
+            Reason given for the first resource which failed, if known.
+        """
+        super(CloudFormationError, self).__init__(message)
+        self.possible_cause = possible_cause
@@ -12,15 +12,76 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import collections
+import functools
+import threading
+import time
+
 import boto3
+from botocore.credentials import RefreshableCredentials
+import botocore.session
 import requests
+from requests.adapters import HTTPAdapter
+try:
+    from urllib3.util.retry import Retry
+except ImportError:
+    from requests.packages.urllib3.util.retry import Retry
 
+from yolo.aws_clients import ClientRegistry
 from yolo import const
+from yolo.credentials.cache import KeyringCache
+from yolo.credentials.cache import to_epoch
+from yolo.credentials.cache import to_timestamp
 import yolo.exceptions
 
 
 RAX_IDENTITY_ENDPOINT = 'https://identity.api.rackspacecloud.com'
 
+# Retry transient API errors (throttling and server-side errors) with
+# exponential backoff: 0.5s, 1s, 2s.
+HTTP_RETRIES = 3
+HTTP_RETRY_BACKOFF_FACTOR = 0.5
+HTTP_RETRY_STATUSES = (429, 500, 502, 503, 504)
+HTTP_POOL_MAXSIZE = 10
+
+_http_session = None
+_http_session_lock = threading.Lock()
+
+
+def _get_retry_config():
+    retry_kwargs = dict(
+        total=HTTP_RETRIES,
+        backoff_factor=HTTP_RETRY_BACKOFF_FACTOR,
+        status_forcelist=HTTP_RETRY_STATUSES,
+        # Hand the last response back to the caller, instead of raising.
+        raise_on_status=False,
+    )
+    try:
+        # Retry on all HTTP methods (including POST).
+        return Retry(allowed_methods=None, **retry_kwargs)
+    except TypeError:
+        # Older versions of urllib3
+        return Retry(method_whitelist=False, **retry_kwargs)
+
+
+def get_http_session():
+    """Get the shared HTTP session for talking to Rackspace APIs.
+
+    The session keeps connections alive (so we only pay for the TLS handshake
+    once per host) and retries throttled and failed requests.
+    """
+    global _http_session
+    with _http_session_lock:
+        if _http_session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(
+                pool_maxsize=HTTP_POOL_MAXSIZE,
+                max_retries=_get_retry_config(),
+            )
+            session.mount('https://', adapter)
+            _http_session = session
+        return _http_session
+
 
 def authenticate(username, apikey):
     """Authenticate to Rackspace Cloud Identity.
@@ -35,6 +96,19 @@ def authenticate(username, apikey):
         Use these values as X-Tenant-Id and X-Auth-Token header values
         (respectively) when making calls to Rackspace APIs.
     """
+    x_tenant_id, x_auth_token, _ = get_auth_token(username, apikey)
+    return x_tenant_id, x_auth_token
+
+
+def get_auth_token(username, apikey):
+    """Get a new Rackspace Cloud Identity token.
+
+    Same as :func:`authenticate`, but also returns when the token expires.
+
+    :returns:
+        3-tuple of (rackspace_account_number, rackspace_auth_token,
+        expires), where ``expires`` is an ISO 8601 timestamp string.
+    """
     auth_params = {
         "auth": {
             "RAX-KSKEY:apiKeyCredentials": {
@@ -43,7 +117,7 @@ def authenticate(username, apikey):
             }
         }
     }
-    response = requests.post(
+    response = get_http_session().post(
         RAX_IDENTITY_ENDPOINT + '/v2.0/tokens',
         json=auth_params,
         headers={'Content-Type': 'application/json'},
@@ -54,7 +128,8 @@ def authenticate(username, apikey):
     x_tenant_id = resp_data['access']['token']['tenant']['id']
     # Rackspace auth token
     x_auth_token = resp_data['access']['token']['id']
-    return x_tenant_id, x_auth_token
+    expires = resp_data['access']['token']['expires']
+    return x_tenant_id, x_auth_token, expires
 
 
 class FAWSClient(object):
@@ -62,33 +137,70 @@ class FAWSClient(object):
 
     FAWS_API_ENDPOINT = 'https://accounts.api.manage.rackspace.com'
 
-    def __init__(self, username, apikey):
+    def __init__(self, username, apikey, credentials_cache=None):
         self.username = username
         self.apikey = apikey
 
+        # Identity tokens and temporary AWS account credentials are cached
+        # across invocations, so that consecutive commands don't each have to
+        # fetch them again.
+        if credentials_cache is None:
+            credentials_cache = KeyringCache()
+        self.credentials_cache = credentials_cache
+
         # API tenant ID/account ID and auth token, lazily loaded.
         self._x_tenant_id = None
         self._x_auth_token = None
 
         # AWS/Boto sessions for each account defined in `stages`
         self._boto3_sessions = {}
+        # Sessions may be requested from multiple threads at once. Make sure
+        # we only authenticate and fetch credentials for an account once.
+        self._auth_lock = threading.Lock()
+        self._session_locks = collections.defaultdict(threading.Lock)
+        self._session_locks_lock = threading.Lock()
+        # botocore clients built from those sessions
+        self.client_registry = ClientRegistry()
 
     @property
     def x_tenant_id(self):
         if self._x_tenant_id is None:
-            self._x_tenant_id, self._x_auth_token = authenticate(
-                self.username, self.apikey
-            )
+            self._authenticate()
         return self._x_tenant_id
 
     @property
     def x_auth_token(self):
         if self._x_auth_token is None:
-            self._x_tenant_id, self._x_auth_token = authenticate(
-                self.username, self.apikey
-            )
+            self._authenticate()
         return self._x_auth_token
 
+    @property
+    def _auth_token_cache_key(self):
+        return 'rackspace_auth_token:{}'.format(self.username)
+
+    def _authenticate(self):
+        """Get an identity token, reusing a cached one if it's still valid."""
+        with self._auth_lock:
+            if self._x_auth_token is not None:
+                # Another thread got here first.
+                return
+            token = self.credentials_cache.get(self._auth_token_cache_key)
+            if token is None:
+                x_tenant_id, x_auth_token, expires = get_auth_token(
+                    self.username, self.apikey
+                )
+                token = [x_tenant_id, x_auth_token]
+                self.credentials_cache.set(
+                    self._auth_token_cache_key, token, to_epoch(expires)
+                )
+            self._x_tenant_id, self._x_auth_token = token
+
+    def _invalidate_auth_token(self):
+        with self._auth_lock:
+            self.credentials_cache.delete(self._auth_token_cache_key)
+            self._x_tenant_id = None
+            self._x_auth_token = None
+
     @property
     def request_headers(self):
         try:
@@ -109,15 +221,27 @@ class FAWSClient(object):
             else:
                 raise
 
+    def _request(self, method, path, **kwargs):
+        url = self.FAWS_API_ENDPOINT + path
+        session = get_http_session()
+        response = session.request(
+            method, url, headers=self.request_headers, **kwargs
+        )
+        if response.status_code == 401:
+            # The (cached) identity token has probably been revoked. Get a
+            # new one and try again.
+            self._invalidate_auth_token()
+            response = session.request(
+                method, url, headers=self.request_headers, **kwargs
+            )
+        return response
+
     def _get(self, path):
         """
         :param str path:
             Request path. For example, /foo/bar (without the host).
         """
-        return requests.get(
-            self.FAWS_API_ENDPOINT + path,
-            headers=self.request_headers,
-        )
+        return self._request('GET', path)
 
     def _post(self, path, body):
         """
@@ -126,14 +250,41 @@ class FAWSClient(object):
         :param dict body:
             JSON/Dict contents to send with the POST.
         """
-        return requests.post(
-            self.FAWS_API_ENDPOINT + path,
-            json=body,
-            headers=self.request_headers,
-        )
+        return self._request('POST', path, json=body)
 
     def get_aws_account_credentials(self, aws_account_number, duration=3600):
-        """Get temporary AWS account credentials."""
+        """Get temporary AWS account credentials.
+
+        Credentials are cached (see :attr:`credentials_cache`) and reused
+        until shortly before they expire. The returned credentials always
+        include an ``expiration`` timestamp.
+        """
+        cache_key = 'aws_credentials:{}:{}'.format(
+            self.username, aws_account_number
+        )
+        creds = self.credentials_cache.get(cache_key)
+        if (creds is not None and
+                not creds.get('credential', {}).get('expiration')):
+            # Cached by an older version of yolo, which didn't always store
+            # the expiration; treat it as expired.
+            creds = None
+        if creds is None:
+            # Be conservative: assume the clock started ticking before we
+            # made the request.
+            requested_at = time.time()
+            creds = self._fetch_aws_account_credentials(
+                aws_account_number, duration
+            )
+            expiration = creds['credential'].get('expiration')
+            if expiration is not None:
+                expires_at = to_epoch(expiration)
+            else:
+                expires_at = requested_at + duration
+                creds['credential']['expiration'] = to_timestamp(expires_at)
+            self.credentials_cache.set(cache_key, creds, expires_at)
+        return creds
+
+    def _fetch_aws_account_credentials(self, aws_account_number, duration):
         path = '/v0/awsAccounts/{}/credentials'.format(aws_account_number)
         body = dict(credential=dict(duration=duration))
         response = self._post(path, body)
@@ -149,6 +300,8 @@ class FAWSClient(object):
                     acct=aws_account_number, username=self.username
                 )
             )
+        # Don't let an error response end up in the credentials cache.
+        response.raise_for_status()
         return response.json()
 
     def list_aws_accounts(self):
@@ -156,19 +309,49 @@ class FAWSClient(object):
         response.raise_for_status()
         return response.json()
 
+    def _get_credentials_metadata(self, acct_num):
+        """Get AWS account credentials in the format botocore expects."""
+        cred = self.get_aws_account_credentials(acct_num)['credential']
+        return dict(
+            access_key=cred['accessKeyId'],
+            secret_key=cred['secretAccessKey'],
+            token=cred['sessionToken'],
+            expiry_time=cred['expiration'],
+        )
+
     def boto3_session(self, acct_num):
+        """Get a boto3 session for the given account.
+
+        The session's credentials are refreshed automatically shortly before
+        they expire, so clients created from it keep working during long
+        running operations (e.g., waiting for a stack update to finish).
+        """
         session = self._boto3_sessions.get(acct_num)
-        if session is None:
-            creds = self.get_aws_account_credentials(acct_num)
-            cred = creds['credential']
-            session = boto3.session.Session(
-                aws_access_key_id=cred['accessKeyId'],
-                aws_secret_access_key=cred['secretAccessKey'],
-                aws_session_token=cred['sessionToken'],
+        if session is not None:
+            return session
+
+        with self._session_locks_lock:
+            session_lock = self._session_locks[acct_num]
+        with session_lock:
+            session = self._boto3_sessions.get(acct_num)
+            if session is not None:
+                # Another thread got here first.
+                return session
+            credentials = RefreshableCredentials.create_from_metadata(
+                metadata=self._get_credentials_metadata(acct_num),
+                refresh_using=functools.partial(
+                    self._get_credentials_metadata, acct_num
+                ),
+                method='faws',
             )
+            botocore_session = botocore.session.get_session()
+            botocore_session._credentials = credentials
+            session = boto3.session.Session(botocore_session=botocore_session)
             self._boto3_sessions[acct_num] = session
-        return session
+            return session
 
     def aws_client(self, acct_num, aws_service, region_name=None, **kwargs):
         session = self.boto3_session(acct_num)
-        return session.client(aws_service, region_name=region_name, **kwargs)
+        return self.client_registry.get_client(
+            session, acct_num, aws_service, region_name=region_name, **kwargs
+        )
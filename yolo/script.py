@@ -17,7 +17,7 @@ import sys
 
 import click
 
-from yolo import client
+from yolo.exceptions import YoloError
 
 
 # Click only supports --help by default.
@@ -29,12 +29,27 @@ def handle_yolo_errors(func):
     def wrapper(*args, **kwargs):
         try:
             return func(*args, **kwargs)
-        except client.YoloError as exc:
+        except YoloError as exc:
             raise click.ClickException(str(exc))
 
     return wrapper
 
 
+def get_client(**kwargs):
+    """Get a :class:`yolo.client.YoloClient` instance.
+
+    ``yolo.client`` (and the AWS SDK, Docker client, etc. that come with it)
+    is only imported once a command actually runs, so that things like
+    ``yolo --help`` stay fast.
+    """
+    from yolo import client
+    # Apply global options (like ``--no-cache``), if any.
+    ctx = click.get_current_context(silent=True)
+    if ctx is not None and ctx.obj:
+        kwargs.setdefault('use_cache', ctx.obj.get('use_cache', True))
+    return client.YoloClient(**kwargs)
+
+
 def deprecated(alt_command):
     """Show a deprecation warning and suggest an alternative command.
 
@@ -155,18 +170,29 @@ def yolo_file_option(**attrs):
 @click.group(
     context_settings=CONTEXT_SETTINGS,
 )
-def cli():
+@click.option(
+    '--no-cache',
+    is_flag=True,
+    default=False,
+    help=(
+        'Ignore locally cached data (such as stack outputs) and fetch '
+        'everything from AWS.'
+    ),
+)
+@click.pass_context
+def cli(ctx, no_cache):
     """Manage infrastructure and services on AWS for multiple accounts/stages.
 
     (Or, "yolo everything into prod".)
     """
+    ctx.obj = dict(use_cache=not no_cache)
 
 
 @cli.command(name='clear-config')
 @handle_yolo_errors
 def clear_config():
     """Clear cached configuration for `yolo`."""
-    client.YoloClient().clear_config()
+    get_client().clear_config()
 
 
 @cli.command(name='show-config')
@@ -175,14 +201,14 @@ def show_config():
     """Show currently cached configuration.
 
     Don't show secrets."""
-    client.YoloClient().show_config()
+    get_client().show_config()
 
 
 @cli.command()
 @handle_yolo_errors
 def login():
     """Login with and cache Rackspace credentials."""
-    client.YoloClient().login()
+    get_client().login()
 
 
 @cli.command(name='use-profile')
@@ -190,25 +216,56 @@ def login():
 @handle_yolo_errors
 def use_profile(profile_name):
     """Make Yolo use an AWS CLI named profile."""
-    client.YoloClient().use_profile(profile_name)
+    get_client().use_profile(profile_name)
 
 
 @cli.command(name='list-accounts')
 @handle_yolo_errors
 def list_accounts():
     """List AWS accounts."""
-    client.YoloClient().list_accounts()
+    get_client().list_accounts()
 
 
 @cli.command(name='deploy-infra')
-@account_option()
-@stage_option()
+@account_option(
+    multiple=True,
+    help='Account name or number. Can be given more than once.',
+)
+@stage_option(
+    multiple=True,
+    help='Stage name. Can be given more than once.',
+)
+@click.option(
+    '--all',
+    'all_stacks',
+    is_flag=True,
+    default=False,
+    help=(
+        'Deploy infrastructure for all accounts and stages defined in the '
+        'yolo file.'
+    ),
+)
 @click.option(
     '--dry-run',
     '-n',
     is_flag=True,
     help='Show infrastructure change summary before actually doing it',
 )
+@click.option(
+    '--plan',
+    is_flag=True,
+    default=False,
+    help=(
+        'Like --dry-run, but save the change summary so that it can be '
+        'applied later with --apply.'
+    ),
+)
+@click.option(
+    '--apply',
+    is_flag=True,
+    default=False,
+    help='Apply the changes saved before with --plan.',
+)
 @yolo_file_option()
 @click.option(
     '--asynchronous',
@@ -231,9 +288,59 @@ def list_accounts():
     ),
 )
 @handle_yolo_errors
-def deploy_infra(yolo_file=None, **kwargs):
-    """Deploy infrastructure from templates."""
-    client.YoloClient(yolo_file=yolo_file).deploy_infra(**kwargs)
+def deploy_infra(yolo_file=None, stage=(), account=(), all_stacks=False,
+                 **kwargs):
+    """Deploy infrastructure from templates.
+
+    With several (or --all) accounts/stages, account-level stacks are
+    deployed first, and everything else concurrently.
+    """
+    client = get_client(yolo_file=yolo_file)
+    if all_stacks or len(stage) + len(account) > 1:
+        client.deploy_infra_many(
+            stages=stage, accounts=account, all_stacks=all_stacks, **kwargs
+        )
+    else:
+        client.deploy_infra(
+            stage=stage[0] if stage else None,
+            account=account[0] if account else None,
+            **kwargs
+        )
+
+
+@cli.command()
+@account_option(
+    multiple=True,
+    help='Account name or number. Can be given more than once.',
+)
+@stage_option(
+    multiple=True,
+    help='Stage name. Can be given more than once.',
+)
+@click.option(
+    '--all',
+    'all_stacks',
+    is_flag=True,
+    default=False,
+    help='Wait for the stacks of all accounts and stages in the yolo file.',
+)
+@click.option(
+    '--timeout',
+    type=int,
+    default=None,
+    help='Give up after this many seconds (default: 3600).',
+)
+@yolo_file_option()
+@handle_yolo_errors
+def wait(yolo_file=None, stage=(), account=(), **kwargs):
+    """Wait for infrastructure stacks to finish updating.
+
+    Use this after `yolo deploy-infra --asynchronous`. Fails if any of the
+    stacks didn't end up in a successful state.
+    """
+    get_client(yolo_file=yolo_file).wait_for_stacks(
+        stages=stage, accounts=account, **kwargs
+    )
 
 
 @cli.command()
@@ -242,7 +349,7 @@ def deploy_infra(yolo_file=None, **kwargs):
 @handle_yolo_errors
 def status(yolo_file=None, **kwargs):
     """Show infrastructure deployments status."""
-    client.YoloClient(yolo_file=yolo_file).status(**kwargs)
+    get_client(yolo_file=yolo_file).status(**kwargs)
 
 
 @cli.command(name='build-lambda')
@@ -260,7 +367,7 @@ def status(yolo_file=None, **kwargs):
 @handle_yolo_errors
 def build_lambda(yolo_file=None, **kwargs):
     """Build Lambda function packages."""
-    client.YoloClient(yolo_file=yolo_file).build_lambda(**kwargs)
+    get_client(yolo_file=yolo_file).build_lambda(**kwargs)
 
 
 @cli.command(name='push')
@@ -270,7 +377,7 @@ def build_lambda(yolo_file=None, **kwargs):
 @handle_yolo_errors
 def push(yolo_file=None, **kwargs):
     """Push a local build, ready it for deployment."""
-    client.YoloClient(yolo_file=yolo_file).push(**kwargs)
+    get_client(yolo_file=yolo_file).push(**kwargs)
 
 
 @cli.command(name='list-builds')
@@ -280,7 +387,7 @@ def push(yolo_file=None, **kwargs):
 @handle_yolo_errors
 def list_builds(yolo_file=None, **kwargs):
     """List the pushed builds for a service/stage."""
-    client.YoloClient(yolo_file=yolo_file).list_builds(**kwargs)
+    get_client(yolo_file=yolo_file).list_builds(**kwargs)
 
 
 @cli.command(name='deploy-lambda')
@@ -310,7 +417,7 @@ def list_builds(yolo_file=None, **kwargs):
 @handle_yolo_errors
 def deploy_lambda(yolo_file=None, **kwargs):
     """Deploy Lambda functions for services."""
-    client.YoloClient(yolo_file=yolo_file).deploy_lambda(**kwargs)
+    get_client(yolo_file=yolo_file).deploy_lambda(**kwargs)
 
 
 @cli.command(name='deploy-s3')
@@ -326,7 +433,7 @@ def deploy_lambda(yolo_file=None, **kwargs):
 @handle_yolo_errors
 def deploy_s3(yolo_file=None, **kwargs):
     """Deploy a built S3 application."""
-    client.YoloClient(yolo_file=yolo_file).deploy_s3(**kwargs)
+    get_client(yolo_file=yolo_file).deploy_s3(**kwargs)
 
 
 @cli.command()
@@ -335,7 +442,7 @@ def deploy_s3(yolo_file=None, **kwargs):
 @handle_yolo_errors
 def shell(yolo_file=None, **kwargs):
     """Launch a Python shell with AWS credentials."""
-    client.YoloClient(yolo_file=yolo_file).shell(**kwargs)
+    get_client(yolo_file=yolo_file).shell(**kwargs)
 
 
 @cli.command()
@@ -364,7 +471,7 @@ def run(yolo_file=None, **kwargs):
         raise click.UsageError(
             "One (and only one) of --account or --stage should be specified."
         )
-    client.YoloClient(yolo_file=yolo_file).run(**kwargs)
+    get_client(yolo_file=yolo_file).run(**kwargs)
 
 
 @cli.command(name='show-parameters')
@@ -374,7 +481,7 @@ def run(yolo_file=None, **kwargs):
 @handle_yolo_errors
 def show_parameters(yolo_file=None, **kwargs):
     """Show centralized config for a service/stage."""
-    client.YoloClient(yolo_file=yolo_file).show_parameters(**kwargs)
+    get_client(yolo_file=yolo_file).show_parameters(**kwargs)
 
 
 @cli.command(name='put-parameters')
@@ -409,7 +516,7 @@ def show_parameters(yolo_file=None, **kwargs):
 @handle_yolo_errors
 def put_parameters(yolo_file=None, **kwargs):
     """Securely store service/stage parameters."""
-    client.YoloClient(yolo_file=yolo_file).put_parameters(**kwargs)
+    get_client(yolo_file=yolo_file).put_parameters(**kwargs)
 
 
 @cli.command(name='ensure-parameters')
@@ -419,7 +526,7 @@ def put_parameters(yolo_file=None, **kwargs):
 @handle_yolo_errors
 def ensure_parameters(yolo_file=None, **kwargs):
     """Ensure that all required parameters are defined in SSM."""
-    client.YoloClient(yolo_file=yolo_file).ensure_parameters(**kwargs)
+    get_client(yolo_file=yolo_file).ensure_parameters(**kwargs)
 
 
 @cli.command(name='show-service')
@@ -429,7 +536,7 @@ def ensure_parameters(yolo_file=None, **kwargs):
 @handle_yolo_errors
 def show_service(yolo_file=None, **kwargs):
     """Show service configuration for a given stage."""
-    client.YoloClient(yolo_file=yolo_file).show_service(**kwargs)
+    get_client(yolo_file=yolo_file).show_service(**kwargs)
 
 
 @cli.command('show-outputs')
@@ -441,7 +548,7 @@ def show_service(yolo_file=None, **kwargs):
 @handle_yolo_errors
 def show_outputs(yolo_file=None, **kwargs):
     """Show infrastructure stack outputs."""
-    client.YoloClient(yolo_file=yolo_file).show_outputs(**kwargs)
+    get_client(yolo_file=yolo_file).show_outputs(**kwargs)
 
 
 @cli.command(name='push-lambda')
@@ -452,7 +559,7 @@ def show_outputs(yolo_file=None, **kwargs):
 @deprecated(alt_command='push')
 def push_lambda(yolo_file=None, **kwargs):
     """DEPRECATED: Use `yolo push`."""
-    client.YoloClient(yolo_file=yolo_file).push(**kwargs)
+    get_client(yolo_file=yolo_file).push(**kwargs)
 
 
 @cli.command(name='upload-s3')
@@ -463,7 +570,7 @@ def push_lambda(yolo_file=None, **kwargs):
 @deprecated(alt_command='push')
 def upload_s3(yolo_file=None, **kwargs):
     """DEPRECATED: Use `yolo push`."""
-    client.YoloClient(yolo_file=yolo_file).push(**kwargs)
+    get_client(yolo_file=yolo_file).push(**kwargs)
 
 
 @cli.command(name='list-s3-builds')
@@ -474,7 +581,7 @@ def upload_s3(yolo_file=None, **kwargs):
 @deprecated(alt_command='list-builds')
 def list_s3_builds(yolo_file=None, **kwargs):
     """DEPRECATED: Use `yolo list-builds`."""
-    client.YoloClient(yolo_file=yolo_file).list_builds(**kwargs)
+    get_client(yolo_file=yolo_file).list_builds(**kwargs)
 
 
 @cli.command(name='list-lambda-builds')
@@ -485,7 +592,7 @@ def list_s3_builds(yolo_file=None, **kwargs):
 @deprecated(alt_command='list-builds')
 def list_lambda_builds(yolo_file=None, **kwargs):
     """DEPRECATED: Use `yolo list-builds`."""
-    client.YoloClient(yolo_file=yolo_file).list_builds(**kwargs)
+    get_client(yolo_file=yolo_file).list_builds(**kwargs)
 
 
 @cli.command(name='deploy-baseline-infra')
@@ -522,4 +629,4 @@ def list_lambda_builds(yolo_file=None, **kwargs):
 @deprecated(alt_command='deploy-infra')
 def deploy_baseline_infra(yolo_file=None, **kwargs):
     """DEPRECATED: Use `yolo deploy-infra`."""
-    client.YoloClient(yolo_file=yolo_file).deploy_infra(**kwargs)
+    get_client(yolo_file=yolo_file).deploy_infra(**kwargs)
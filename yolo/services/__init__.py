@@ -43,6 +43,8 @@ class BaseService(object):
         self.timeout = timeout
 
     def aws_client(self, acct_num, aws_service, region_name=None):
+        # Configs with the same options are considered equal, so this still
+        # reuses clients built by earlier calls.
         config = botocore.client.Config(
             connect_timeout=60,
             read_timeout=self.timeout,
@@ -18,12 +18,10 @@ import os
 import tempfile
 
 import botocore.exceptions
-import docker
 import tabulate
 from ruamel import yaml
 
 import yolo.build
-import yolo.client
 from yolo import const
 import yolo.exceptions
 import yolo.services
@@ -83,6 +81,10 @@ class LambdaService(yolo.services.BaseService):
         self._python_build_lambda_function(service_cfg, build_log)
 
     def _python_build_lambda_function(self, service_cfg, build_log):
+        # The Docker client is only needed for builds; don't import it
+        # otherwise.
+        import docker
+
         build_config = service_cfg['build']
         try:
             # Allow connecting to older Docker versions (e.g. CircleCI 1.0)
@@ -143,7 +145,8 @@ class LambdaService(yolo.services.BaseService):
             working_dir=working_dir,
             dependencies_path=dependencies_path,
             dist_dir=dist_dir,
-            build_cache_dir=build_cache_dir)
+            build_cache_dir=build_cache_dir,
+            include=include)
         LOG.warning(
             "build_volume_container created (%s)",
             build_volume_container.short_id
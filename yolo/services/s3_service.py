@@ -65,11 +65,9 @@ class S3Service(yolo.services.BaseService):
 
         print('creating build for S3 service "{}"...'.format(service))
 
-        # TODO(larsbutler): try to avoid fetching extra sets of credentials. We
-        # do this when constructing AWS clients, so there is some redundancy
-        # here. This is definitely a performance due to the redudnant cred
-        # fetching calls, but I haven't yet measured exactly what the impact
-        # is.
+        # NOTE: Credentials are cached by the FAWS client, so this doesn't
+        # cost an extra round trip if a client for this account has already
+        # been created.
         creds = self.faws_client.get_aws_account_credentials(
             self.context.account.account_number
         )
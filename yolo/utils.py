@@ -12,6 +12,12 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+try:
+    from collections.abc import Mapping
+except ImportError:
+    # Python2 fallback
+    from collections import Mapping
+import contextlib
 import datetime
 import difflib
 import json
@@ -24,6 +30,7 @@ except ImportError:
     # Python3 fallback
     from io import BytesIO as StringIO  # noqa
 import sys
+import threading
 import time
 
 
@@ -87,6 +94,29 @@ def get_unified_diff(a_data, b_data, fromfile=None, tofile=None):
     return diff
 
 
+# Same rule as before: only the start of the key is checked.
+_IDENTIFIER_RE = re.compile('[a-zA-Z_][a-zA-Z0-9_]*')
+_PYTHON_KEYWORDS = frozenset([
+    'False', 'None', 'True', 'and', 'as', 'assert', 'break', 'class',
+    'continue', 'def', 'del', 'elif', 'else', 'except', 'finally',
+    'for', 'from', 'global', 'if', 'import', 'in', 'is', 'lambda',
+    'nonlocal', 'not', 'or', 'pass', 'raise', 'return', 'try', 'while',
+    'with', 'yield'
+])
+
+
+def _check_identifier(identifier):
+    """Test if a key identifier is valid according to the Python lexer.
+
+    Source: https://stackoverflow.com/questions/10120295/valid-characters-in-a-python-class-name
+    """
+    if (identifier in _PYTHON_KEYWORDS or
+            not _IDENTIFIER_RE.match(identifier)):
+        raise SyntaxError(
+            'Key name is not a valid identifier or is reserved keyword.'
+        )
+
+
 class DottedDict(dict):
     """Dictionary object allow keys to be accessed as attributes.
 
@@ -95,70 +125,162 @@ class DottedDict(dict):
     ``d.foo.bar``.
 
     Naturally, this limits key names to those which are valid attribute names.
+    Keys are checked once, when they are added.
+
+    Nested dicts are wrapped in a ``DottedDict`` the first time they are
+    accessed (with ``d.foo``, ``d['foo']`` or ``d.get('foo')``), rather
+    than up front. Iterating over ``items()``/``values()`` gives the stored
+    values as they are.
 
-    Credit to https://github.com/josh-paul for this implementation.
+    Credit to https://github.com/josh-paul for the original implementation.
     """
+    # Data is only stored in the dict itself.
+    __slots__ = ()
+
     def __init__(self, *args, **kwargs):
         super(DottedDict, self).__init__(*args, **kwargs)
-        for arg in args:
-            if isinstance(arg, dict):
-                for key, value in arg.items():
-                    if isinstance(value, dict):
-                        value = DottedDict(**value)
-                    self[key] = value
-
-        if kwargs:
-            for key, value in kwargs.items():
-                if isinstance(value, dict):
-                    value = DottedDict(**value)
-                self[key] = value
-
-        # Catch for case of importing values in the .items() format
-        if self.items() and not self.__dict__.items():
-            for key, value in self.items():
-                self.__setitem__(key, value)
+        for key in self:
+            _check_identifier(key)
+
+    def __getitem__(self, key):
+        value = dict.__getitem__(self, key)
+        if isinstance(value, dict) and not isinstance(value, DottedDict):
+            value = DottedDict(value)
+            dict.__setitem__(self, key, value)
+        return value
+
+    def get(self, key, default=None):
+        if key in self:
+            return self[key]
+        return default
 
     def __getattr__(self, attr):
+        # Called for every key lookup, so avoid extra method calls.
         try:
-            return self.__dict__[attr]
+            value = dict.__getitem__(self, attr)
         # Do this to match python default behavior
         except KeyError:
             raise AttributeError(attr)
+        if isinstance(value, dict) and not isinstance(value, DottedDict):
+            value = DottedDict(value)
+            dict.__setitem__(self, attr, value)
+        return value
 
     def __setattr__(self, key, value):
-        if self._is_valid_identifier(key):
-            self.__setitem__(key, value)
+        self[key] = value
 
     def __setitem__(self, key, value):
-        if self._is_valid_identifier(key):
-            super(DottedDict, self).__setitem__(key, value)
-            self.__dict__.update({key: value})
+        _check_identifier(key)
+        super(DottedDict, self).__setitem__(key, value)
 
     def __delattr__(self, item):
-        self.__delitem__(item)
-
-    def __delitem__(self, key):
-        super(DottedDict, self).__delitem__(key)
-        del self.__dict__[key]
-
-    def _is_valid_identifier(self, identifier):
-        """Test if a key identifier is valid according to the Python lexer.
-
-        Source: https://stackoverflow.com/questions/10120295/valid-characters-in-a-python-class-name
-        """
-        python_keywords = [
-            'False', 'None', 'True', 'and', 'as', 'assert', 'break', 'class',
-            'continue', 'def', 'del', 'elif', 'else', 'except', 'finally',
-            'for', 'from', 'global', 'if', 'import', 'in', 'is', 'lambda',
-            'nonlocal', 'not', 'or', 'pass', 'raise', 'return', 'try', 'while',
-            'with', 'yield'
-        ]
-        if (identifier not in python_keywords and
-                re.match('[a-zA-Z_][a-zA-Z0-9_]*', identifier)):
-            return True
-        raise SyntaxError(
-            'Key name is not a valid identifier or is reserved keyword.'
-        )
+        del self[item]
+
+    def update(self, *args, **kwargs):
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def copy(self):
+        return DottedDict(self)
+
+
+class LazyMapping(Mapping):
+    """Read-only mapping whose contents are only loaded when first accessed.
+
+    Like :class:`DottedDict`, keys can also be accessed as attributes, so
+    this can be used in place of a nested ``DottedDict`` in a template
+    context (for example, for stack outputs which require API calls to look
+    up).
+
+    :param loader:
+        Callable which takes no arguments and returns a ``dict``. It is
+        called at most once.
+    """
+
+    def __init__(self, loader):
+        self._loader = loader
+        self._data = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        """Load the contents now (if they haven't been loaded already)."""
+        if self._data is None:
+            with self._lock:
+                if self._data is None:
+                    self._data = DottedDict(self._loader())
+        return self._data
+
+    @property
+    def is_loaded(self):
+        return self._data is not None
+
+    def __getitem__(self, key):
+        return self.load()[key]
+
+    def __iter__(self):
+        return iter(self.load())
+
+    def __len__(self):
+        return len(self.load())
+
+    def __getattr__(self, attr):
+        if attr.startswith('_'):
+            # Private attributes are never keys; also guards against
+            # recursion before `__init__` has run (e.g., when copying).
+            raise AttributeError(attr)
+        try:
+            return self.load()[attr]
+        except KeyError:
+            raise AttributeError(attr)
+
+    def __repr__(self):
+        if self.is_loaded:
+            return '{}({!r})'.format(type(self).__name__, self._data)
+        return '{}(<not loaded>)'.format(type(self).__name__)
+
+
+class ThreadOutputRouter(object):
+    """File-like object which keeps output of some threads separate.
+
+    Use it in place of ``sys.stdout`` while running things concurrently:
+    anything written by a thread inside a :meth:`capture` block is collected
+    for that thread, while everything else goes straight to the wrapped
+    stream. This way, the output of each task can be shown in one piece
+    instead of being interleaved with the others.
+    """
+
+    def __init__(self, stream):
+        self._stream = stream
+        self._local = threading.local()
+
+    @contextlib.contextmanager
+    def capture(self):
+        """Collect output of the current thread into a list of strings."""
+        buf = []
+        self._local.buffer = buf
+        try:
+            yield buf
+        finally:
+            self._local.buffer = None
+
+    def write(self, data):
+        buf = getattr(self._local, 'buffer', None)
+        if buf is not None:
+            buf.append(data)
+        else:
+            self._stream.write(data)
+
+    def flush(self):
+        if getattr(self._local, 'buffer', None) is None:
+            self._stream.flush()
+
+    def __getattr__(self, attr):
+        return getattr(self._stream, attr)
 
 
 class S3UploadProgress(object):
@@ -24,6 +24,15 @@ import yolo.exceptions
 class VerboseCloudFormationWaiter(object):
     """Custom waiter that prints on progress to standard outpout.
 
+    Instead of polling the stack status, the stack events are tailed: only
+    events newer than the last one seen are fetched, each resource status
+    change is printed, and the wait is over as soon as the stack itself
+    reaches a final state.
+
+    Polling starts out quick (so short operations return quickly) and backs
+    off while nothing happens (e.g., during long resource creations, like
+    CloudFront distributions).
+
     This should help avoid build failures in certain CI systems for long-running
     stack creations/updates (especially when they involve CloudFront
     distributions).
@@ -41,8 +50,23 @@ class VerboseCloudFormationWaiter(object):
         WAITER_TYPE_UPDATE: 'updating',
         WAITER_TYPE_DELETE: 'deleting',
     }
-    POLL_INTERVAL = 30
-    MAX_TRIES = 120
+    # Stack status which marks the start of each operation
+    WAITER_TYPE_START_STATUS_MAP = {
+        WAITER_TYPE_CREATE: 'CREATE_IN_PROGRESS',
+        WAITER_TYPE_UPDATE: 'UPDATE_IN_PROGRESS',
+        WAITER_TYPE_DELETE: 'DELETE_IN_PROGRESS',
+    }
+    # Poll intervals (in seconds): start with MIN_POLL_INTERVAL, and multiply
+    # by POLL_BACKOFF (up to MAX_POLL_INTERVAL) each time there's nothing
+    # new.
+    MIN_POLL_INTERVAL = 2
+    MAX_POLL_INTERVAL = 30
+    POLL_BACKOFF = 1.5
+    # Print a reminder that we are still waiting if nothing has been printed
+    # for this many seconds.
+    KEEPALIVE_INTERVAL = 60
+    # Give up after this many seconds.
+    MAX_WAIT_TIME = 3600
 
     def __init__(self, cf_client, waiter_type):
         self.cf_client = cf_client
@@ -52,43 +76,167 @@ class VerboseCloudFormationWaiter(object):
             raise ValueError('Unknown waiter type: {}'.format(waiter_type))
 
         self.target_status = self.WAITER_TYPE_STATUS_MAP[self.waiter_type]
+        self.start_status = self.WAITER_TYPE_START_STATUS_MAP[self.waiter_type]
         self.action = self.WAITER_TYPE_ACTION_MAP[self.waiter_type]
 
-    def wait(self, **kwargs):
-        tries = 0
+    def get_last_event_id(self, StackName):
+        """Get the ID of the newest event of a stack.
+
+        Call this right before starting an operation on an existing stack, and
+        pass the result to :meth:`wait`, so that the wait is anchored to the
+        new operation (and not to a previous one that just finished).
+
+        :returns:
+            The event ID, or ``None`` if the stack doesn't exist (yet).
+        """
+        try:
+            response = self.cf_client.describe_stack_events(
+                StackName=StackName
+            )
+        except ClientError as exc:
+            if 'does not exist' in str(exc):
+                return None
+            raise
+        events = response['StackEvents']
+        return events[0]['EventId'] if events else None
+
+    def wait(self, StackName, after_event_id=None):
+        """Wait for the operation on a stack to complete.
+
+        :param str StackName:
+            Name (or ID) of the stack. Pass the ID of a new stack, so that
+            the events of a deleted stack with the same name are ignored.
+        :param str after_event_id:
+            ID of the newest event before the operation was started (see
+            :meth:`get_last_event_id`). Only newer events are considered.
+            Leave this out for new stacks; all of their events belong to the
+            current operation.
+        """
+        started_at = time.time()
+        try:
+            response = self.cf_client.describe_stacks(StackName=StackName)
+        except ClientError as exc:
+            if (
+                'ValidationError' in str(exc) and
+                'does not exist' in str(exc) and
+                self.waiter_type == self.WAITER_TYPE_DELETE
+            ):
+                # On a stack delete, if the stack doesn't exist anymore, it
+                # means success.
+                return
+            else:
+                raise
+        [stack] = response['Stacks']
+        # Events of deleted stacks can only be looked up by ID.
+        stack_id = stack['StackId']
+
+        last_event_id = None
+        first_failure = None
+        interval = self.MIN_POLL_INTERVAL
+        last_output_at = started_at
         while True:
-            tries += 1
-            if tries > self.MAX_TRIES:
-                # We have reached the max. number of retries, raising an
-                # exception.
-                raise RuntimeError('The stack operation took too long to complete.')
-            try:
-                response = self.cf_client.describe_stacks(**kwargs)
-            except ClientError as exc:
-                if (
-                    'ValidationError' in str(exc) and
-                    'does not exist' in str(exc) and
-                    self.waiter_type == self.WAITER_TYPE_DELETE
-                ):
-                    # On a stack delete, if the stack doesn't exist anymore, it
-                    # means success.
-                    break
-                else:
-                    raise
-            stack_status = response['Stacks'][0]['StackStatus']
-            if stack_status == self.target_status:
-                # All good!
-                break
-            elif 'IN_PROGRESS' in stack_status:
-                # Still in progress, let's wait a bit, and retry
-                time.sleep(self.POLL_INTERVAL)
-                print('Still {} stack, please be patient...'.format(self.action))
-                continue
+            if last_event_id is None:
+                events = self._get_events_since_start(
+                    stack_id, after_event_id=after_event_id
+                )
+            else:
+                events = self._get_events_since(stack_id, last_event_id)
+
+            for event in events:
+                self._print_event(event)
+                if (first_failure is None and
+                        event['ResourceStatus'].endswith('_FAILED') and
+                        event.get('ResourceStatusReason')):
+                    first_failure = event['ResourceStatusReason']
+
+                if self._is_stack_event(event, stack_id):
+                    status = event['ResourceStatus']
+                    if status == self.target_status:
+                        # All good!
+                        return
+                    elif not status.endswith('_IN_PROGRESS'):
+                        # This means we have reached an unexpected state,
+                        # let's raise an exception.
+                        raise yolo.exceptions.CloudFormationError(
+                            'The stack reached an unexpected state: '
+                            '{}'.format(status),
+                            possible_cause=first_failure,
+                        )
+
+            now = time.time()
+            if events:
+                last_event_id = events[-1]['EventId']
+                last_output_at = now
+                interval = self.MIN_POLL_INTERVAL
             else:
-                # This means we have reached an unexpected state, let's raise
-                # an exception.
-                raise yolo.exceptions.CloudFormationError(
-                    'The stack reached an unexpected state: {}'.format(
-                        stack_status
-                    )
+                interval = min(
+                    interval * self.POLL_BACKOFF, self.MAX_POLL_INTERVAL
                 )
+                if now - last_output_at >= self.KEEPALIVE_INTERVAL:
+                    print('Still {} stack, please be patient...'.format(
+                        self.action
+                    ))
+                    last_output_at = now
+
+            if now - started_at > self.MAX_WAIT_TIME:
+                # We have waited long enough, raising an exception.
+                raise RuntimeError('The stack operation took too long to complete.')
+            time.sleep(interval)
+
+    def _iter_events(self, stack_id):
+        """Iterate over the events of a stack, newest first."""
+        kwargs = dict(StackName=stack_id)
+        while True:
+            response = self.cf_client.describe_stack_events(**kwargs)
+            for event in response['StackEvents']:
+                yield event
+            if not response.get('NextToken'):
+                break
+            kwargs['NextToken'] = response['NextToken']
+
+    def _get_events_since(self, stack_id, last_event_id):
+        """Get all events after ``last_event_id``, oldest first."""
+        events = []
+        for event in self._iter_events(stack_id):
+            if event['EventId'] == last_event_id:
+                break
+            events.append(event)
+        events.reverse()
+        return events
+
+    def _get_events_since_start(self, stack_id, after_event_id=None):
+        """Get all events of the current operation, oldest first.
+
+        The operation starts with the newest "start" event (e.g.,
+        ``CREATE_IN_PROGRESS``) of the stack itself, newer than
+        ``after_event_id`` (if given). If there's no such event (yet),
+        nothing is returned; events of a previous operation must not be
+        mistaken for the current one.
+        """
+        events = []
+        for event in self._iter_events(stack_id):
+            if event['EventId'] == after_event_id:
+                break
+            events.append(event)
+            if (self._is_stack_event(event, stack_id) and
+                    event['ResourceStatus'] == self.start_status):
+                events.reverse()
+                return events
+        return []
+
+    @staticmethod
+    def _is_stack_event(event, stack_id):
+        # Nested stacks show up as resources of type
+        # `AWS::CloudFormation::Stack` as well, but with their own ID.
+        return event['PhysicalResourceId'] == stack_id
+
+    @staticmethod
+    def _print_event(event):
+        reason = event.get('ResourceStatusReason')
+        print('  {time} {status:<40} {type:<40} {logical_id}{reason}'.format(
+            time=event['Timestamp'].strftime('%H:%M:%S'),
+            status=event['ResourceStatus'],
+            type=event['ResourceType'],
+            logical_id=event['LogicalResourceId'],
+            reason=' ({})'.format(reason) if reason else '',
+        ))
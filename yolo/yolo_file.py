@@ -13,14 +13,25 @@
 # limitations under the License.
 
 from collections import namedtuple
+from collections import OrderedDict
+import copy
+import hashlib
+import json
+import os
 import sys
+import threading
+import warnings
 
 import jinja2
+import jinja2.meta
+import jinja2.nodes
 from ruamel import yaml
 import voluptuous as volup
 
+import yolo
 import yolo.exceptions
 from yolo import utils
+from yolo.utils import Mapping
 
 PY3 = sys.version_info >= (2, 8)
 if PY3:
@@ -34,6 +45,236 @@ AWSAccount = namedtuple(
 )
 
 
+class Stage(object):
+    """A stage from a yolo file, with its account resolved.
+
+    :ivar str name:
+        Name of the stage.
+    :ivar account:
+        :class:`AWSAccount` the stage is deployed to.
+    :ivar str region:
+        AWS region the stage is deployed to.
+    :ivar bool protected:
+        ``True`` if destructive actions are not allowed on the stage.
+    :ivar dict config:
+        Raw stage configuration from the yolo file.
+    """
+    __slots__ = ('name', 'account', 'region', 'protected', 'config')
+
+    def __init__(self, name, account, config):
+        self.name = name
+        self.account = account
+        self.region = config['region']
+        self.protected = config.get('protected', False)
+        self.config = config
+
+
+class Service(object):
+    """A service from a yolo file.
+
+    :ivar str name:
+        Name of the service.
+    :ivar str type:
+        Type of the service (see :attr:`YoloFile.SERVICE_TYPES`).
+    :ivar dict config:
+        Raw service configuration from the yolo file.
+    """
+    __slots__ = ('name', 'type', 'config', '_parameters')
+
+    def __init__(self, name, config):
+        self.name = name
+        self.type = config['type']
+        self.config = config
+
+        # Precompute the parameters for each stage: the "default" ones,
+        # overridden by any stage-specific ones with the same name.
+        stages = config.get('deploy', {}).get('parameters', {}).get(
+            'stages', {}
+        )
+        defaults = OrderedDict(
+            (param['name'], param)
+            for param in stages.get(YoloFile.DEFAULT_STAGE, [])
+        )
+        self._parameters = {YoloFile.DEFAULT_STAGE: list(defaults.values())}
+        for stage, stage_params in stages.items():
+            params = defaults.copy()
+            params.update((param['name'], param) for param in stage_params)
+            self._parameters[stage] = list(params.values())
+
+    def get_parameters(self, stage):
+        """Get the parameter definitions (`list` of `dict`) for a stage."""
+        return self._parameters.get(
+            stage, self._parameters[YoloFile.DEFAULT_STAGE]
+        )
+
+
+# Markers for template syntax (variables, tags and comments).
+TEMPLATE_MARKERS = ('{{', '{%', '{#')
+
+_NOT_ANALYZED = object()
+# Environment for rendering individual strings. Unlike rendering a whole
+# document, the trailing newline of e.g. a block scalar is significant.
+_JINJA_ENV = jinja2.Environment(keep_trailing_newline=True)
+# Compiled template and variable paths for each template string, keyed by
+# the string itself.
+_TEMPLATE_STRINGS = {}
+# Memoized render results, keyed by content hash and variables fingerprint.
+_RENDER_CACHE = OrderedDict()
+_RENDER_CACHE_SIZE = 32
+_RENDER_CACHE_LOCK = threading.Lock()
+
+
+def _load_yaml(data):
+    """Parse YAML, using the faster C-based loader if it is available.
+
+    The C-based loader resolves values the same way, except that it ignores
+    a ``%YAML 1.1`` directive. Documents with a version directive are always
+    parsed with the pure Python loader.
+    """
+    if isinstance(data, bytes):
+        data = data.decode('utf-8')
+    c_loader = getattr(yaml, 'CSafeLoader', None)
+    if c_loader is not None and not data.lstrip().startswith('%YAML'):
+        try:
+            with warnings.catch_warnings():
+                # Warnings about YAML 1.1 floats (like `1e3`), which the pure
+                # Python loader doesn't emit.
+                warnings.simplefilter('ignore')
+                return yaml.load(data, Loader=c_loader)
+        except yaml.YAMLError:
+            # Let the pure Python loader report the error.
+            pass
+    return yaml.safe_load(data)
+
+
+def _is_template_string(value):
+    return (
+        isinstance(value, (str, unicode)) and
+        any(marker in value for marker in TEMPLATE_MARKERS)
+    )
+
+
+def _iter_template_strings(value):
+    """Yield all keys/values in a nested structure containing templates."""
+    if isinstance(value, dict):
+        for key, item in value.items():
+            if _is_template_string(key):
+                yield key
+            for text in _iter_template_strings(item):
+                yield text
+    elif isinstance(value, list):
+        for item in value:
+            for text in _iter_template_strings(item):
+                yield text
+    elif _is_template_string(value):
+        yield value
+
+
+def _compile_template_string(text):
+    """Compile a template string and find the variable paths it uses.
+
+    :returns:
+        2-tuple of the :class:`jinja2.Template` and a `set` of paths (see
+        :func:`_get_variable_paths`).
+    :raises:
+        :class:`jinja2.TemplateSyntaxError` if ``text`` is not a complete
+        template.
+    """
+    compiled = _TEMPLATE_STRINGS.get(text)
+    if compiled is None:
+        ast = _JINJA_ENV.parse(text)
+        compiled = (
+            _JINJA_ENV.from_string(ast), _get_variable_paths(ast)
+        )
+        _TEMPLATE_STRINGS[text] = compiled
+    return compiled
+
+
+def _get_variable_paths(ast):
+    """Find the (static) paths of all variables used in a template.
+
+    For each variable which comes from the render context, the path is the
+    variable name followed by the names of any attributes/items looked up on
+    it, for as long as those are constant. For example,
+    ``{{ stage.outputs['Foo'] | lower }}`` uses ``('stage', 'outputs',
+    'Foo')``, and ``{{ stage.outputs[name] }}`` uses ``('stage',
+    'outputs')``.
+    """
+    context_names = jinja2.meta.find_undeclared_variables(ast)
+    parents = {}
+    stack = [ast]
+    while stack:
+        node = stack.pop()
+        for child in node.iter_child_nodes():
+            parents[id(child)] = node
+            stack.append(child)
+
+    paths = set()
+    for name in ast.find_all(jinja2.nodes.Name):
+        if name.ctx != 'load' or name.name not in context_names:
+            continue
+        path = [name.name]
+        node = name
+        while True:
+            parent = parents.get(id(node))
+            if (isinstance(parent, jinja2.nodes.Getattr) and
+                    parent.node is node):
+                grandparent = parents.get(id(parent))
+                if (isinstance(grandparent, jinja2.nodes.Call) and
+                        grandparent.node is parent):
+                    # Method call, like `foo.bar.upper()`
+                    break
+                path.append(parent.attr)
+            elif (isinstance(parent, jinja2.nodes.Getitem) and
+                    parent.node is node and
+                    isinstance(parent.arg, jinja2.nodes.Const)):
+                path.append(parent.arg.value)
+            else:
+                break
+            node = parent
+        paths.add(tuple(path))
+    return paths
+
+
+def _get_variables_fingerprint(paths, variables):
+    """Hash the values of the given variable paths."""
+    values = []
+    for path in sorted(paths, key=repr):
+        value = variables
+        for part in path:
+            # Same lookup rules as in templates: attribute, then item.
+            try:
+                value = getattr(value, part)
+            except (AttributeError, TypeError):
+                try:
+                    value = value[part]
+                except (LookupError, TypeError):
+                    value = _NOT_ANALYZED
+                    break
+        values.append((path, value))
+    serialized = json.dumps(
+        values,
+        sort_keys=True,
+        default=lambda obj: dict(obj) if isinstance(obj, Mapping) else repr(obj)
+    )
+    return hashlib.sha1(serialized.encode('utf-8')).hexdigest()
+
+
+def _render_value(value, variables):
+    """Render all template strings in a nested structure."""
+    if isinstance(value, dict):
+        return {
+            _render_value(key, variables): _render_value(item, variables)
+            for key, item in value.items()
+        }
+    elif isinstance(value, list):
+        return [_render_value(item, variables) for item in value]
+    elif _is_template_string(value):
+        template, _paths = _compile_template_string(value)
+        return template.render(**variables)
+    return value
+
+
 class YoloFile(object):
     """Object representation of a yolo.yaml file."""
     DEFAULT_STAGE = 'default'
@@ -184,26 +425,70 @@ class YoloFile(object):
         volup.Required('services'): SERVICES_SCHEMA,
     })
 
-    def __init__(self, content):
+    def __init__(self, content, validate=True):
         """
         :param content:
             `dict` representation of the contents read from a yolo.yaml file.
+        :param bool validate:
+            Validate ``content`` against the yolo file schema. Only skip this
+            for contents which are known to be valid already.
         """
         self._raw_content = content
-        self._validate()
+        if validate:
+            self._validate()
         self.app_name = self._raw_content['name']
+        self._content_hash = None
+        self._variable_paths = _NOT_ANALYZED
+        # Indexes of accounts, stages and services; see `_build_indexes`.
+        self._accounts_index = None
+        self._stages_index = None
+        self._services_index = None
 
     @classmethod
     def from_file(cls, file_obj):
         """Load a yolo.yaml file from an open file-like object."""
-        content = yaml.safe_load(file_obj)
+        content = _load_yaml(file_obj.read())
         return cls(content)
 
     @classmethod
-    def from_path(cls, path):
-        """Load a yolo.yaml file given a path to the file."""
-        with open(path) as fp:
-            return cls.from_file(fp)
+    def from_path(cls, path, cache=None):
+        """Load a yolo.yaml file given a path to the file.
+
+        :param str path:
+            Path to the yolo.yaml file.
+        :param cache:
+            Optional :class:`yolo.cache.FileCache` for the parsed and
+            validated contents of the file. There is one entry per file name
+            (several yolo files can share a directory, and a cache), checked
+            against the hash of the file contents and the version of yolo; if
+            neither changed, parsing and validation are skipped.
+        """
+        with open(path, 'rb') as fp:
+            data = fp.read()
+        if cache is None:
+            return cls(_load_yaml(data))
+
+        # Only the latest version of each file is kept in the cache.
+        cache_key = 'yolofile-{}'.format(os.path.basename(path))
+        content_key = '{}-{}'.format(
+            yolo.__version__, hashlib.sha256(data).hexdigest()
+        )
+        entry = cache.get(cache_key)
+        if entry is not None and entry['key'] == content_key:
+            return cls(entry['content'], validate=False)
+
+        yf = cls(_load_yaml(data))
+        # Only cache contents which survive the trip through JSON unchanged
+        # (for example, YAML can also contain dates or non-string keys).
+        try:
+            cacheable = (
+                json.loads(json.dumps(yf._raw_content)) == yf._raw_content
+            )
+        except (TypeError, ValueError):
+            cacheable = False
+        if cacheable:
+            cache.set(cache_key, dict(key=content_key, content=yf._raw_content))
+        return yf
 
     def to_fileobj(self):
         """Dump this `YoloFile` contents to file-like object."""
@@ -245,6 +530,39 @@ class YoloFile(object):
                     'stage is defined.'
                 )
 
+    def _build_indexes(self):
+        """Build the indexes used for looking up accounts/stages/services.
+
+        This is only done once, the first time any of them is needed.
+        """
+        accounts_index = {}
+        for acct in self.accounts:
+            account = AWSAccount(
+                name=acct['name'],
+                account_number=acct['account_number'],
+                default_region=acct['default_region'],
+            )
+            # Accounts can be referred to by name or by number; the first
+            # account which matches wins.
+            accounts_index.setdefault(account.name, account)
+            accounts_index.setdefault(account.account_number, account)
+        self._accounts_index = accounts_index
+
+        stages_index = {}
+        for name, stage_cfg in self.stages.items():
+            account = accounts_index.get(stage_cfg['account'])
+            if account is None:
+                # Let `normalize_account` raise an error once this stage is
+                # actually used.
+                continue
+            stages_index[name] = Stage(name, account, stage_cfg)
+        self._stages_index = stages_index
+
+        self._services_index = {
+            name: Service(name, service_cfg)
+            for name, service_cfg in self.services.items()
+        }
+
     def normalize_account(self, account):
         """Take an account name or number and return an `AWSAccount` instance.
 
@@ -260,37 +578,141 @@ class YoloFile(object):
             :class:`yolo.exceptions.YoloError` if the account name or number
             can't be found.
         """
-        # Check if it's an alias or a real number.
-        account_name = None
-        account_number = None
-        default_region = None
-        for acct in self.accounts:
-            if acct['name'] == account:
-                # We got an account alias
-                account_name = account
-                account_number = acct['account_number']
-                default_region = acct['default_region']
-                break
-            elif acct['account_number'] == account:
-                # We found a matching account
-                account_name = acct['name']
-                account_number = account
-                default_region = acct['default_region']
-                break
-        else:
+        if self._accounts_index is None:
+            self._build_indexes()
+        try:
+            return self._accounts_index[account]
+        except KeyError:
             # We didn't find a matching account number or alias
             raise yolo.exceptions.YoloError(
                 'Unable to find a matching account number or alias for '
                 '"{}"'.format(account)
             )
-        return AWSAccount(
-            name=account_name,
-            account_number=account_number,
-            default_region=default_region,
-        )
+
+    def get_stage(self, stage):
+        """Get a :class:`Stage` by name.
+
+        Stages which are not defined in the yolo file (ad-hoc stages) are
+        based on the "default" stage config.
+        """
+        if self._stages_index is None:
+            self._build_indexes()
+        if stage in self._stages_index:
+            return self._stages_index[stage]
+        stage_cfg = self.get_stage_config(stage)
+        return Stage(stage, self.normalize_account(stage_cfg['account']),
+                     stage_cfg)
+
+    def get_service(self, service):
+        """Get a :class:`Service` by name.
+
+        :raises:
+            :class:`yolo.exceptions.YoloError` if the service is not defined.
+        """
+        if self._services_index is None:
+            self._build_indexes()
+        try:
+            return self._services_index[service]
+        except KeyError:
+            raise yolo.exceptions.YoloError(
+                'Unknown service "{service}". Valid services: '
+                '{services}.'.format(
+                    service=service,
+                    services=', '.join(sorted(self._services_index)),
+                )
+            )
+
+    @property
+    def content_hash(self):
+        """SHA-1 hash of the (raw) contents of this yolo file."""
+        if self._content_hash is None:
+            self._content_hash = hashlib.sha1(
+                json.dumps(
+                    self._raw_content, sort_keys=True, default=repr
+                ).encode('utf-8')
+            ).hexdigest()
+        return self._content_hash
+
+    def _get_variable_paths(self):
+        """Get the paths of all template variables used in this yolo file.
+
+        For example, ``{{ stage.outputs.Foo }}`` uses the path
+        ``('stage', 'outputs', 'Foo')``.
+
+        :returns:
+            `set` of paths (as tuples), or ``None`` if the contents can't be
+            rendered value by value (see :meth:`render`).
+        """
+        if self._variable_paths is _NOT_ANALYZED:
+            paths = set()
+            try:
+                for text in _iter_template_strings(self._raw_content):
+                    paths.update(_compile_template_string(text)[1])
+            except jinja2.TemplateSyntaxError:
+                paths = None
+            self._variable_paths = paths
+        return self._variable_paths
+
+    def get_referenced_outputs(self):
+        """Find out which stack outputs are used by template variables.
+
+        For example, if the yolo file contains ``{{ stage.outputs.Foo }}``,
+        the stage stack outputs are needed to render it.
+
+        :returns:
+            `set` containing 'stage' and/or 'account'.
+        """
+        paths = self._get_variable_paths()
+        if paths is None:
+            # Let `render` report the error; assume everything is needed.
+            return {'stage', 'account'}
+        return {
+            path[0] for path in paths
+            if path[0] in ('stage', 'account') and
+            (len(path) == 1 or path[1] == 'outputs')
+        }
 
     def render(self, **variables):
-        # Render variables into the yolo file.
+        """Render template variables into the yolo file.
+
+        Each string (key or value) containing template syntax is rendered
+        separately with a precompiled template, and everything else is left
+        untouched. Since only the contents of strings change, the result
+        doesn't need to be validated again.
+
+        Results are memoized, keyed by the contents of the file and the
+        values of the variables it uses.
+
+        :returns:
+            New :class:`YoloFile` instance with the rendered contents.
+        """
+        paths = self._get_variable_paths()
+        if paths is None:
+            # Template tags span multiple strings (e.g., an `{% if %}` in
+            # one value and the `{% endif %}` in another), so we need to
+            # render the whole document at once.
+            return self._render_document(**variables)
+        if not paths and not any(_iter_template_strings(self._raw_content)):
+            # Nothing to render.
+            return YoloFile(copy.deepcopy(self._raw_content), validate=False)
+
+        key = (self.content_hash, _get_variables_fingerprint(paths, variables))
+        with _RENDER_CACHE_LOCK:
+            content = _RENDER_CACHE.get(key)
+        if content is None:
+            content = _render_value(self._raw_content, variables)
+            with _RENDER_CACHE_LOCK:
+                _RENDER_CACHE[key] = content
+                while len(_RENDER_CACHE) > _RENDER_CACHE_SIZE:
+                    _RENDER_CACHE.popitem(last=False)
+        return YoloFile(copy.deepcopy(content), validate=False)
+
+    def _render_document(self, **variables):
+        """Render the yolo file as a single template.
+
+        The contents are dumped to YAML, rendered, parsed and validated
+        again.
+        """
         template = jinja2.Template(
             yaml.dump(self._raw_content, Dumper=yaml.RoundTripDumper)
         )